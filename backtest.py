@@ -0,0 +1,141 @@
+import argparse
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from elo_engine import load_season, season_from_store, replay, build_configs
+from matchstore import MatchStore
+
+# Expected scores are clipped away from 0 and 1 so one confident miss cannot make log-loss infinite
+EPSILON = 1e-15
+
+# Season loaded once per worker process by _init_worker
+season = None
+match_ages = None
+
+
+def match_age_groups(season):
+    """Age group of each match: team1's age, or team2's when team1's is unknown (NaN when neither is known)"""
+    ages1 = season.team_ages[season.team1]
+    ages2 = season.team_ages[season.team2]
+    return np.where(np.isnan(ages1), ages2, ages1)
+
+
+def score_predictions(expected, result):
+    """Log-loss, Brier score and accuracy of team1 win probabilities against actual results"""
+    if len(result) == 0:
+        return {'matches': 0, 'log_loss': float('nan'), 'brier': float('nan'), 'accuracy': float('nan')}
+    clipped = np.clip(expected, EPSILON, 1 - EPSILON)
+    log_loss = -np.mean(result * np.log(clipped) + (1 - result) * np.log(1 - clipped))
+    brier = np.mean((expected - result) ** 2)
+    accuracy = np.mean((expected > 0.5) == (result == 1.0))
+    return {'matches': len(result), 'log_loss': float(log_loss), 'brier': float(brier), 'accuracy': float(accuracy)}
+
+
+def evaluate(expected, skip_first=0):
+    """Score one config's expected scores overall and per age group, ignoring the first skip_first matches"""
+    result = season.result1[skip_first:]
+    expected = expected[skip_first:]
+    ages = match_ages[skip_first:]
+
+    by_age = {}
+    for age in np.unique(ages[~np.isnan(ages)]):
+        mask = ages == age
+        by_age[int(age)] = score_predictions(expected[mask], result[mask])
+    unknown = np.isnan(ages)
+    if unknown.any():
+        by_age[None] = score_predictions(expected[unknown], result[unknown])
+
+    return score_predictions(expected, result), by_age
+
+
+def _init_worker(db_path, store_dir=None):
+    """Load the season once per worker process; from a match store, workers share its memory-mapped pages"""
+    global season, match_ages
+    if store_dir:
+        season = season_from_store(MatchStore(store_dir))
+    else:
+        conn = sqlite3.connect(db_path)
+        season = load_season(conn.cursor())
+        conn.close()
+    match_ages = match_age_groups(season)
+
+
+def backtest_batch(configs, skip_first=0):
+    """Replay a batch of configs together and score each; seconds are the batch time split evenly"""
+    start = time.perf_counter()
+    _, expected = replay(season, configs, record_expected=True)
+    scores = [evaluate(row, skip_first) for row in expected]
+    seconds = (time.perf_counter() - start) / len(configs)
+    return [(config, overall, by_age, seconds) for config, (overall, by_age) in zip(configs, scores)]
+
+
+def run_grid(db_path, configs, processes, batch_size, skip_first=0, store_dir=None):
+    """Fan batches of configs out over a process pool, each worker holding its own copy of the season"""
+    batches = [configs[i:i + batch_size] for i in range(0, len(configs), batch_size)]
+
+    if processes <= 1:
+        _init_worker(db_path, store_dir)
+        return [row for batch in batches for row in backtest_batch(batch, skip_first)]
+
+    results = []
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(db_path, store_dir)) as pool:
+        for rows in pool.map(backtest_batch, batches, [skip_first] * len(batches)):
+            results.extend(rows)
+    return results
+
+
+def report(results, n_matches):
+    """Print one line per config, best log-loss first, then the per-age breakdown of the best config"""
+    results = sorted(results, key=lambda row: row[1]['log_loss'])
+
+    print(f"\n{'K':>6} {'per_year':>8} {'log_loss':>9} {'brier':>7} {'accuracy':>8} {'seconds':>8} {'matches/s':>11}")
+    for config, overall, _, seconds in results:
+        rate = n_matches / seconds if seconds > 0 else float('inf')
+        print(f"{config.k:>6g} {config.curve.per_year:>8g} {overall['log_loss']:>9.4f} {overall['brier']:>7.4f} "
+              f"{overall['accuracy']:>8.3f} {seconds:>8.3f} {rate:>11,.0f}")
+
+    config, _, by_age, _ = results[0]
+    print(f"\nBest: K={config.k:g}, per_year={config.curve.per_year:g}. By age group:")
+    print(f"{'age':>6} {'matches':>8} {'log_loss':>9} {'brier':>7} {'accuracy':>8}")
+    for age, scores in sorted(by_age.items(), key=lambda item: (item[0] is None, item[0] or 0)):
+        label = 'none' if age is None else str(age)
+        print(f"{label:>6} {scores['matches']:>8} {scores['log_loss']:>9.4f} {scores['brier']:>7.4f} {scores['accuracy']:>8.3f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backtest ELO predictions and grid-search K and the age offset")
+    parser.add_argument('--db', default='vbdatav4.db', help="database to read matches from")
+    parser.add_argument('--store', help="read matches from this matchstore.py directory instead of the database")
+    parser.add_argument('--k', type=float, nargs='+', default=[16, 24, 32, 40, 48, 64],
+                        help="K factors to try")
+    parser.add_argument('--per-year', type=float, nargs='+', default=[0, 50, 100, 150, 200],
+                        help="starting-rating steps per year of team age to try")
+    parser.add_argument('--processes', type=int, default=os.cpu_count(),
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--batch', type=int, default=1,
+                        help="configs replayed together per task; larger batches amortize the replay")
+    parser.add_argument('--skip-first', type=int, default=0,
+                        help="leave the first N matches out of the scores while ratings settle")
+    args = parser.parse_args()
+
+    configs = build_configs(args.k, args.per_year)
+    print(f"Backtesting {len(configs)} configurations on {args.processes} processes...")
+
+    start = time.perf_counter()
+    results = run_grid(args.db, configs, args.processes, args.batch, args.skip_first, args.store)
+    wall = time.perf_counter() - start
+
+    if args.store:
+        n_matches = len(MatchStore(args.store))
+    else:
+        conn = sqlite3.connect(args.db)
+        n_matches = conn.execute("SELECT COUNT(*) FROM matches").fetchone()[0]
+        conn.close()
+
+    report(results, n_matches)
+    print(f"\nTotal wall time {wall:.2f}s for {len(configs)} configurations "
+          f"({len(configs) * n_matches / wall:,.0f} matches/s overall)")
@@ -0,0 +1,286 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+import requests
+
+from elo_engine import load_season, replay, DEFAULT_CONFIG
+from schema import remove_duplicate_matches
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_TABLES = ['events', 'divisions', 'teams', 'enrollments', 'matches']
+MATCH_COLUMNS = '''bracket, team1, team2, team2_won,
+    set1_team1_score, set1_team2_score, set2_team1_score, set2_team2_score,
+    set3_team1_score, set3_team2_score, match_time'''
+
+# Metrics compared against --baseline, and whether a higher value is better
+METRICS = [
+    ('crawl', 'requests_per_sec', True),
+    ('crawl', 'rows_per_sec', True),
+    ('crawl', 'seconds', False),
+    ('load', 'rows_per_sec', True),
+    ('bulk_load', 'rows_per_sec', True),
+    ('load', 'write_rows_per_sec', True),
+    ('bulk_load', 'write_rows_per_sec', True),
+    ('dedupe', 'seconds', False),
+    ('elo', 'matches_per_sec', True),
+    ('elo_engine', 'matches_per_sec', True),
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_mock(args, port, log):
+    """Run mockaes.py in its own process, so serving does not compete with the scraper for the GIL"""
+    command = [sys.executable, os.path.join(REPO_DIR, 'mockaes.py'), '--port', str(port),
+               '--events', str(args.events), '--divisions', str(args.divisions), '--teams', str(args.teams),
+               '--latency', str(args.latency), '--jitter', str(args.jitter), '--error-rate', str(args.error_rate)]
+    process = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            requests.get(f'{base_url}/__stats', timeout=1)
+            return process, base_url
+        except requests.ConnectionError:
+            if process.poll() is not None or time.monotonic() > deadline:
+                process.kill()
+                raise RuntimeError("mock AES server did not start; see the benchmark log")
+            time.sleep(0.05)
+
+
+def mock_stats(base_url):
+    return requests.get(f'{base_url}/__stats', timeout=5).json()
+
+
+def count_rows(cursor):
+    counts = {}
+    for table in DATA_TABLES:
+        cursor.execute(f"SELECT COUNT(*) FROM {table}")
+        counts[table] = cursor.fetchone()[0]
+    return counts
+
+
+def bench_crawl(workdir, base_url, concurrency, log):
+    """
+    Full crawl of the mock into a fresh database: requests/sec and rows inserted/sec.
+    Responses are cached in the workdir for bench_load.
+    """
+    before = mock_stats(base_url)
+    command = [sys.executable, os.path.join(REPO_DIR, 'samplescraper.py'), '--base-url', base_url,
+               '--cache-dir', os.path.join(workdir, 'http_cache'),
+               '--concurrency', str(concurrency), '--rate', '1000000', '--fixed-rate']
+    start = time.perf_counter()
+    subprocess.run(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT, check=True)
+    seconds = time.perf_counter() - start
+    after = mock_stats(base_url)
+
+    conn = sqlite3.connect(os.path.join(workdir, 'vbdatav4.db'))
+    cursor = conn.cursor()
+    rows = count_rows(cursor)
+    cursor.execute("SELECT COUNT(*) FROM frontier WHERE status = 'failed'")
+    failed = cursor.fetchone()[0]
+    conn.close()
+
+    request_count = after['requests'] - before['requests']
+    total_rows = sum(rows.values())
+    return {
+        'seconds': seconds,
+        'requests': request_count,
+        'errors': after['errors'] - before['errors'],
+        'megabytes': (after['bytes'] - before['bytes']) / 1e6,
+        'requests_per_sec': request_count / seconds,
+        'rows': rows,
+        'rows_per_sec': total_rows / seconds,
+        'failed_urls': failed,
+    }
+
+
+def bench_load(workdir, base_url, concurrency, log, bulk):
+    """
+    Replay the crawl's cached responses into a fresh database, so only parsing and writing are timed:
+    the normal write path, or --bulk-load (secondary indexes built at the end). Writer time, from
+    the scraper's metrics, is the write path alone; for a bulk load it includes the index build.
+    """
+    db_name = 'bulk.db' if bulk else 'load.db'
+    metrics_path = os.path.join(workdir, f'{db_name}.metrics.jsonl')
+    command = [sys.executable, os.path.join(REPO_DIR, 'samplescraper.py'), '--base-url', base_url,
+               '--replay', '--cache-dir', os.path.join(workdir, 'http_cache'), '--db', db_name,
+               '--concurrency', str(concurrency), '--rate', '1000000', '--fixed-rate',
+               '--metrics-jsonl', metrics_path]
+    if bulk:
+        command.append('--bulk-load')
+    start = time.perf_counter()
+    subprocess.run(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT, check=True)
+    seconds = time.perf_counter() - start
+
+    write_seconds = 0.0
+    with open(metrics_path, encoding='utf-8') as f:
+        for line in f:
+            entry = json.loads(line)
+            if entry['metric'] == 'aes_writer_busy_seconds_total' and 'total' in entry:
+                write_seconds += entry['total']
+            elif entry['metric'] == 'aes_index_seconds' and 'sum' in entry:
+                write_seconds += entry['sum']
+    os.remove(metrics_path)
+
+    db_path = os.path.join(workdir, db_name)
+    conn = sqlite3.connect(db_path)
+    rows = count_rows(conn.cursor())
+    conn.close()
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    total_rows = sum(rows.values())
+    return {'seconds': seconds, 'rows': rows, 'rows_per_sec': total_rows / seconds,
+            'write_seconds': write_seconds, 'write_rows_per_sec': total_rows / write_seconds}
+
+
+def bench_dedupe(db_path, workdir):
+    """Time remove_duplicate_matches on a copy of the crawl with every match stored twice"""
+    dedupe_path = os.path.join(workdir, 'dedupe.db')
+    shutil.copyfile(db_path, dedupe_path)
+    conn = sqlite3.connect(dedupe_path)
+    cursor = conn.cursor()
+    cursor.execute("DROP INDEX IF EXISTS idx_matches_natural_key")
+    cursor.execute(f"INSERT INTO matches ({MATCH_COLUMNS}) SELECT {MATCH_COLUMNS} FROM matches")
+    conn.commit()
+    cursor.execute("SELECT COUNT(*) FROM matches")
+    total = cursor.fetchone()[0]
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        remove_duplicate_matches(cursor)
+    conn.commit()
+    seconds = time.perf_counter() - start
+
+    cursor.execute("SELECT COUNT(*) FROM matches")
+    removed = total - cursor.fetchone()[0]
+    conn.close()
+    os.remove(dedupe_path)
+    return {'seconds': seconds, 'matches': total, 'removed': removed}
+
+
+def bench_elo():
+    """Match-by-match ratings (elo.py) and the vectorized replay (elo_engine.py) over the crawled matches"""
+    # elo opens vbdatav4.db in the working directory when imported, so import it after chdir
+    import elo
+
+    matches = elo.load_matches()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        elo.process_matches(matches)
+    elo_seconds = time.perf_counter() - start
+
+    season = load_season(elo.cursor)
+    start = time.perf_counter()
+    replay(season, [DEFAULT_CONFIG])
+    engine_seconds = time.perf_counter() - start
+
+    return (
+        {'seconds': elo_seconds, 'matches': len(matches),
+         'matches_per_sec': len(matches) / elo_seconds if elo_seconds else float('inf')},
+        {'seconds': engine_seconds, 'matches': len(season),
+         'matches_per_sec': len(season) / engine_seconds if engine_seconds else float('inf')},
+    )
+
+
+def report(results, baseline=None):
+    crawl = results['crawl']
+    print(f"\nCrawl:      {crawl['seconds']:.2f}s, {crawl['requests']} requests ({crawl['errors']} errors), "
+          f"{crawl['megabytes']:.1f} MB, {crawl['failed_urls']} failed URLs")
+    print(f"            {crawl['requests_per_sec']:,.0f} requests/s, {crawl['rows_per_sec']:,.0f} rows inserted/s "
+          f"({', '.join(f'{count} {table}' for table, count in crawl['rows'].items())})")
+    dedupe = results['dedupe']
+    for section, label in (('load', 'Load:'), ('bulk_load', 'Bulk load:')):
+        load = results[section]
+        print(f"{label:<12}{load['seconds']:.2f}s replaying the cache, {load['rows_per_sec']:,.0f} rows inserted/s; "
+              f"{load['write_seconds']:.2f}s in the writer, {load['write_rows_per_sec']:,.0f} rows/s")
+    print(f"Dedupe:     {dedupe['seconds']:.3f}s to remove {dedupe['removed']} of {dedupe['matches']} matches")
+    print(f"ELO:        {results['elo']['matches_per_sec']:,.0f} matches/s (elo.py), "
+          f"{results['elo_engine']['matches_per_sec']:,.0f} matches/s (elo_engine.py)")
+
+    if baseline:
+        print("\nAgainst baseline:")
+        for section, metric, higher_is_better in METRICS:
+            old = baseline.get(section, {}).get(metric)
+            new = results[section][metric]
+            if not old:
+                continue
+            change = (new - old) / old * 100
+            worse = change < 0 if higher_is_better else change > 0
+            flag = '  <-- regression' if worse and abs(change) >= 10 else ''
+            print(f"  {section + '.' + metric:<28} {old:>12,.2f} -> {new:>12,.2f} ({change:+.1f}%){flag}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end benchmark of the scraper and ELO against a local mock AES server")
+    parser.add_argument('--events', type=int, default=50, help="mock events")
+    parser.add_argument('--divisions', type=int, default=8, help="divisions per mock event")
+    parser.add_argument('--teams', type=int, default=8, help="teams per mock division")
+    parser.add_argument('--latency', type=float, default=0.0, help="milliseconds of mock server latency")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random +/- milliseconds around --latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of mock requests that fail")
+    parser.add_argument('--concurrency', type=int, default=8, help="scraper --concurrency")
+    parser.add_argument('--workdir', help="directory for the benchmark database and log (default: a temp dir)")
+    parser.add_argument('--keep', action='store_true', help="keep the temp workdir afterwards")
+    parser.add_argument('--json', metavar='PATH', help="also write the results as JSON")
+    parser.add_argument('--baseline', metavar='PATH', help="JSON results of an earlier run to compare against")
+    args = parser.parse_args()
+
+    workdir = os.path.abspath(args.workdir or tempfile.mkdtemp(prefix='aes-bench-'))
+    os.makedirs(workdir, exist_ok=True)
+    db_path = os.path.join(workdir, 'vbdatav4.db')
+    if os.path.exists(db_path):
+        parser.error(f"{db_path} already exists; the benchmark needs an empty workdir")
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+    os.chdir(workdir)
+
+    log_path = os.path.join(workdir, 'benchmark.log')
+    print(f"Benchmarking in {workdir} (output of the scraper and mock server in {log_path})")
+    with open(log_path, 'w') as log:
+        mock, base_url = start_mock(args, free_port(), log)
+        try:
+            print(f"Crawling {args.events} events x {args.divisions} divisions x {args.teams} teams from {base_url}...")
+            results = {'config': vars(args), 'crawl': bench_crawl(workdir, base_url, args.concurrency, log)}
+        finally:
+            mock.terminate()
+            mock.wait()
+
+        print("Timing loads from the response cache...")
+        results['load'] = bench_load(workdir, base_url, args.concurrency, log, bulk=False)
+        results['bulk_load'] = bench_load(workdir, base_url, args.concurrency, log, bulk=True)
+
+    print("Timing duplicate removal...")
+    results['dedupe'] = bench_dedupe(db_path, workdir)
+    print("Timing ELO...")
+    results['elo'], results['elo_engine'] = bench_elo()
+
+    report(results, baseline)
+
+    if json_path:
+        with open(json_path, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nWrote {json_path}")
+
+    if not args.workdir and not args.keep:
+        os.chdir(REPO_DIR)
+        shutil.rmtree(workdir)
@@ -0,0 +1,162 @@
+import queue
+import sqlite3
+import threading
+import time
+
+import metrics
+
+DEFAULT_COMMIT_ROWS = 2000     # commit once this many rows have changed...
+DEFAULT_COMMIT_SECONDS = 1.0   # ...or this long after the first uncommitted write
+DEFAULT_QUEUE_SIZE = 1000      # units of work waiting for the writer before submit() blocks
+
+# Bulk loads commit bigger batches (but no less often: frontier claims wait for the write lock)
+# and checkpoint the WAL on their own schedule
+BULK_COMMIT_ROWS = 20000
+BULK_CHECKPOINT_SECONDS = 30.0
+BULK_CACHE_KB = 256 * 1024
+
+_STOP = object()
+
+
+class DatabaseWriter(threading.Thread):
+    """
+    Dedicated thread owning the only write connection to the database.
+    Other threads submit units of work, callables taking a cursor, which the writer
+    applies in order and batches into transactions committed on row-count/time thresholds.
+    Each unit runs inside its own savepoint, so a failing unit is rolled back on its own
+    without losing the rest of the batch. A unit can register after_commit() callbacks, for
+    bookkeeping that must only happen once its rows are really in the database.
+
+    bulk=True is for first loads: larger transactions, synchronous=OFF (a process crash loses
+    nothing in WAL mode, only a power cut can, and the load can be rerun), and a PASSIVE WAL
+    checkpoint every BULK_CHECKPOINT_SECONDS in place of SQLite's automatic checkpoints.
+    """
+
+    def __init__(self, db_path, commit_rows=None, commit_seconds=DEFAULT_COMMIT_SECONDS,
+                 maxsize=DEFAULT_QUEUE_SIZE, bulk=False):
+        super().__init__(name='db-writer', daemon=True)
+        self.db_path = db_path
+        self.bulk = bulk
+        if commit_rows is None:
+            commit_rows = BULK_COMMIT_ROWS if bulk else DEFAULT_COMMIT_ROWS
+        self.commit_rows = commit_rows
+        self.commit_seconds = commit_seconds
+        self.last_checkpoint = time.monotonic()
+        self.queue = queue.Queue(maxsize)
+        self.rows_written = 0
+        self.commits = 0
+        self.busy_seconds = 0.0  # applying units and committing, i.e. not waiting for work
+        self.unit_callbacks = []       # registered by the unit being applied
+        self.committed_callbacks = []  # of units applied in the open transaction
+
+    def submit(self, unit):
+        """Queue a callable(cursor) to be applied by the writer thread; blocks while the queue is full"""
+        self.queue.put(unit)
+
+    def after_commit(self, callback):
+        """
+        From inside a unit (on the writer thread): call callback() on the writer thread once the
+        unit's transaction has committed. Dropped if the unit fails and is rolled back.
+        """
+        self.unit_callbacks.append(callback)
+
+    def flush(self):
+        """Block until everything submitted so far has been committed"""
+        done = threading.Event()
+        self.queue.put(done)
+        done.wait()
+
+    def close(self):
+        """Commit outstanding work and stop the writer thread"""
+        self.queue.put(_STOP)
+        self.join()
+
+    def run(self):
+        # isolation_level=None: transactions are managed explicitly below
+        conn = sqlite3.connect(self.db_path, timeout=60, isolation_level=None)
+        conn.execute('PRAGMA synchronous=OFF' if self.bulk else 'PRAGMA synchronous=NORMAL')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        if self.bulk:
+            conn.execute('PRAGMA wal_autocheckpoint=0')
+            conn.execute(f'PRAGMA cache_size=-{BULK_CACHE_KB}')
+        cursor = conn.cursor()
+
+        in_transaction = False
+        batch_started = 0.0
+        batch_changes = conn.total_changes
+
+        try:
+            while True:
+                timeout = None
+                if in_transaction:
+                    timeout = max(0.0, batch_started + self.commit_seconds - time.monotonic())
+
+                try:
+                    unit = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    unit = None
+
+                if unit is _STOP:
+                    break
+
+                if isinstance(unit, threading.Event):
+                    if in_transaction:
+                        self._commit(cursor, conn.total_changes - batch_changes)
+                        in_transaction = False
+                    unit.set()
+                    continue
+
+                if unit is not None:
+                    started = time.perf_counter()
+                    if not in_transaction:
+                        cursor.execute('BEGIN')
+                        in_transaction = True
+                        batch_started = time.monotonic()
+                        batch_changes = conn.total_changes
+
+                    cursor.execute('SAVEPOINT unit')
+                    self.unit_callbacks = []
+                    try:
+                        unit(cursor)
+                        cursor.execute('RELEASE unit')
+                        self.committed_callbacks.extend(self.unit_callbacks)
+                    except Exception as e:
+                        cursor.execute('ROLLBACK TO unit')
+                        cursor.execute('RELEASE unit')
+                        print(f"Database write failed: {e}")
+                    self._busy(time.perf_counter() - started)
+
+                if in_transaction:
+                    changes = conn.total_changes - batch_changes
+                    if changes >= self.commit_rows or time.monotonic() - batch_started >= self.commit_seconds:
+                        self._commit(cursor, changes)
+                        in_transaction = False
+
+            if in_transaction:
+                self._commit(cursor, conn.total_changes - batch_changes)
+        finally:
+            conn.close()
+
+    def _busy(self, seconds):
+        self.busy_seconds += seconds
+        metrics.inc('aes_writer_busy_seconds_total', seconds)
+
+    def _commit(self, cursor, changes):
+        started = time.perf_counter()
+        with metrics.timer('aes_commit_seconds'):
+            cursor.execute('COMMIT')
+        callbacks, self.committed_callbacks = self.committed_callbacks, []
+        for callback in callbacks:
+            callback()
+        self.rows_written += changes
+        self.commits += 1
+        metrics.inc('aes_commits_total')
+        metrics.inc('aes_rows_written_total', changes)
+        if changes:
+            print(f"Committed {changes} rows ({self.rows_written} total)")
+
+        if self.bulk and time.monotonic() - self.last_checkpoint >= BULK_CHECKPOINT_SECONDS:
+            with metrics.timer('aes_checkpoint_seconds'):
+                cursor.execute('PRAGMA wal_checkpoint(PASSIVE)')
+            self.last_checkpoint = time.monotonic()
+        self._busy(time.perf_counter() - started)
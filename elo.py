@@ -1,9 +1,18 @@
+import argparse
 import sqlite3
+import time
+from operator import itemgetter
+
+import metrics
+import schema
 
 # create elo table
 conn = sqlite3.connect("vbdatav4.db")
 cursor = conn.cursor()
 
+# team_elo_history.match_time of matches without a start time: sorts before every real time
+NO_TIME = -2 ** 63
+
 def get_starting_elo(team_age):
     """
     Calculate starting ELO based on team age.
@@ -21,20 +30,143 @@ def get_starting_elo(team_age):
 def create_elo_table():
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS team_elo (
-        teamId TEXT PRIMARY KEY,
+        team INTEGER PRIMARY KEY,
         elo REAL DEFAULT 1500,
-        FOREIGN KEY (teamId) REFERENCES teams(teamId)
+        updated_at REAL,
+        FOREIGN KEY (team) REFERENCES teams(id)
     )
     ''')
+    # Ratings keep their row when they change, so delta exports watermark on updated_at
+    if not schema.has_column(cursor, 'team_elo', 'updated_at'):
+        cursor.execute('ALTER TABLE team_elo ADD COLUMN updated_at REAL')
+        cursor.execute('UPDATE team_elo SET updated_at = ?', (time.time(),))
     conn.commit()
     print("ELO table created")
 
 def delete_elo_table():
-    """Delete the team_elo table to allow recalculation"""
+    """Delete the team_elo table (with its history and watermark) to allow recalculation"""
     cursor.execute("DROP TABLE IF EXISTS team_elo")
+    cursor.execute("DROP TABLE IF EXISTS team_elo_history")
+    cursor.execute("DROP TABLE IF EXISTS elo_state")
     conn.commit()
     print("ELO table deleted")
 
+def create_elo_state_table():
+    """
+    Single-row table holding the incremental watermark: the last match applied in
+    chronological order, the highest matchId applied, how many matches that was, the
+    latest matches.updated_at seen (0 when no applied match had one), when the ratings
+    were last replayed from scratch (delta exports start new history bases after that),
+    and when the last run finished (rankserver.py reloads when that changes).
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS elo_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        last_match_time INTEGER,
+        last_match_id INTEGER,
+        max_match_id INTEGER,
+        match_count INTEGER,
+        matches_updated_at REAL,
+        replayed_at REAL,
+        finished_at REAL
+    )
+    ''')
+    # Tables from before these columns get them empty; an empty matches_updated_at forces one full replay
+    for column in ('matches_updated_at', 'replayed_at', 'finished_at'):
+        if not schema.has_column(cursor, 'elo_state', column):
+            cursor.execute(f"ALTER TABLE elo_state ADD COLUMN {column} REAL")
+    conn.commit()
+
+def create_elo_history_table():
+    """
+    One row per team per match with the rating before and after it.
+    seq is the match's position in the chronological replay. The table is clustered on
+    (team, match_time, seq), so "rating as of" lookups are a single index seek.
+    Matches without a start time are stored with match_time NO_TIME (they sort first).
+    """
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS team_elo_history (
+        team INTEGER NOT NULL,
+        match_time INTEGER NOT NULL,
+        seq INTEGER NOT NULL,
+        matchId INTEGER NOT NULL,
+        elo_before REAL NOT NULL,
+        elo_after REAL NOT NULL,
+        PRIMARY KEY (team, match_time, seq)
+    ) WITHOUT ROWID
+    ''')
+    conn.commit()
+
+def save_elo_history(history, batch_size=50000):
+    """Insert history rows in large executemany batches; committed together with the ratings"""
+    # Rows are appended in chronological order, so a stable sort on team alone puts them in
+    # primary key order and the inserts append to the B-tree instead of splitting pages at random
+    history.sort(key=itemgetter(0))
+    for start in range(0, len(history), batch_size):
+        cursor.executemany('''
+        INSERT OR REPLACE INTO team_elo_history (team, match_time, seq, matchId, elo_before, elo_after)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ''', history[start:start + batch_size])
+    print(f"Saved {len(history)} ELO history rows")
+
+def as_of_epoch(when):
+    """Epoch seconds of a datetime or 'YYYY-MM-DD[ HH:MM:SS]' string, read like stored match times"""
+    epoch = schema.to_epoch(when)
+    if epoch is None:
+        raise ValueError(f"not a date or datetime: {when!r}")
+    return epoch
+
+def get_team_elo_as_of(team_id, when):
+    """
+    Rating of one team (by AES teamId) going into `when` (a datetime or 'YYYY-MM-DD[ HH:MM:SS]' string):
+    its rating after the last match that started at or before `when`, or None if it had not played yet.
+    """
+    cursor.execute('''
+    SELECT elo_after FROM team_elo_history
+    WHERE team = (SELECT id FROM teams WHERE teamId = ?) AND match_time <= ?
+    ORDER BY match_time DESC, seq DESC
+    LIMIT 1
+    ''', (team_id, as_of_epoch(when)))
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def get_elos_as_of(when):
+    """Ratings of every team that had played by `when`, as {teamId: elo}"""
+    # One descending seek on the (team, match_time, seq) primary key per team, as in get_team_elo_as_of
+    cursor.execute('''
+    SELECT t.teamId, (
+        SELECT h.elo_after FROM team_elo_history h
+        WHERE h.team = t.id AND h.match_time <= ?
+        ORDER BY h.match_time DESC, h.seq DESC
+        LIMIT 1
+    )
+    FROM teams t
+    ''', (as_of_epoch(when),))
+    return {team_id: elo for team_id, elo in cursor.fetchall() if elo is not None}
+
+def load_elo_state():
+    """
+    Return (last_match_time, last_match_id, max_match_id, match_count, matches_updated_at,
+    replayed_at) or None before the first run
+    """
+    cursor.execute('''
+    SELECT last_match_time, last_match_id, max_match_id, match_count, matches_updated_at, replayed_at
+    FROM elo_state WHERE id = 1
+    ''')
+    return cursor.fetchone()
+
+def save_elo_state(last_match, max_match_id, match_count, matches_updated_at, replayed_at):
+    """Record the watermark; committed together with the ratings by save_elos_to_database"""
+    last_match_time, last_match_id = last_match
+    cursor.execute('''
+    INSERT OR REPLACE INTO elo_state (
+        id, last_match_time, last_match_id, max_match_id, match_count, matches_updated_at, replayed_at,
+        finished_at
+    )
+    VALUES (1, ?, ?, ?, ?, ?, ?, ?)
+    ''', (last_match_time, last_match_id, max_match_id, match_count, matches_updated_at, replayed_at,
+          time.time()))
+
 # ELO 
 def expected_score(rating_a, rating_b):
     return 1 / (1 + 10 ** ((rating_b - rating_a) / 400))
@@ -53,7 +185,7 @@ def report_elo_rankings():
     cursor.execute('''
     SELECT t.teamName, t.teamAge, te.elo 
     FROM team_elo te 
-    JOIN teams t ON te.teamId = t.teamId 
+    JOIN teams t ON t.id = te.team
     ORDER BY te.elo DESC
     ''')
     elo_rankings = cursor.fetchall()
@@ -66,33 +198,50 @@ def report_elo_rankings():
     print("ELO calculations complete")
 
 
-# select matches ordered by match_datetime (oldest first)
-# This ensures ELO calculations are processed chronologically
+# select matches ordered by match_time (oldest first)
+# This ensures ELO calculations are processed chronologically.
+# Ties (and matches without a start time, which sort first) are broken by matchId,
+# so a full replay and incremental runs apply matches in exactly the same order.
+# idx_matches_time holds (match_time, matchId) in this order, so SQLite sorts nothing.
 
-def process_matches():
-    """Process all matches and calculate ELO ratings in memory"""
+def load_matches(after_match_id=None):
+    """Load matches in chronological order, optionally only those ingested after matchId `after_match_id`"""
+    if after_match_id is None:
+        cursor.execute("SELECT * FROM matches ORDER BY match_time, matchId")
+    else:
+        cursor.execute('''
+        SELECT * FROM matches WHERE matchId > ?
+        ORDER BY match_time, matchId
+        ''', (after_match_id,))
+    return cursor.fetchall()
+
+def process_matches(matches=None, team_elos=None, history=None, first_seq=0):
+    """
+    Apply matches to team_elos in memory and return the updated ratings.
+    By default every match is replayed from scratch; pass the new matches and the
+    stored ratings to continue an earlier run instead. When a history list is given,
+    a team_elo_history row is appended to it for both teams of every match,
+    numbered from first_seq.
+    """
     print("Loading matches and team data...")
     
     # Load all matches ordered by datetime
-    cursor.execute("SELECT * FROM matches ORDER BY match_datetime ASC")
-    matches = cursor.fetchall()
+    if matches is None:
+        matches = load_matches()
     
     # Load all teams to get their ages for starting ELO
-    cursor.execute("SELECT teamId, teamAge FROM teams")
+    cursor.execute("SELECT id, teamAge FROM teams")
     teams_data = {row[0]: row[1] for row in cursor.fetchall()}
     
-    # Load existing ELO ratings from database
-    cursor.execute("SELECT teamId, elo FROM team_elo")
-    existing_elos = {row[0]: row[1] for row in cursor.fetchall()}
-    
     # Initialize ELO dictionary in memory with existing ratings
-    team_elos = existing_elos.copy()
+    team_elos = dict(team_elos or {})
     
-    print(f"Found {len(existing_elos)} existing ELO ratings in database")
+    print(f"Starting from {len(team_elos)} existing ELO ratings")
     print(f"Processing {len(matches)} matches...")
     
+    started = time.perf_counter()
     for i, match in enumerate(matches):
-        match_id, bracket, team1_id, team2_id, team2_won, *scores = match
+        match_id, bracket, team1_id, team2_id, team2_won, *scores = match  # team ids: teams.id
         
         # Initialize ELOs for teams if they don't exist (use existing or calculate new)
         for team_id in (team1_id, team2_id):
@@ -113,33 +262,140 @@ def process_matches():
         # Update in-memory ELOs
         team_elos[team1_id] = new_elo1
         team_elos[team2_id] = new_elo2
+
+        if history is not None:
+            match_time = NO_TIME if match[11] is None else match[11]
+            seq = first_seq + i
+            history.append((team1_id, match_time, seq, match_id, elo1, new_elo1))
+            history.append((team2_id, match_time, seq, match_id, elo2, new_elo2))
         
         # Progress indicator
         if (i + 1) % 1000 == 0:
             print(f"Processed {i + 1}/{len(matches)} matches...")
     
+    metrics.observe('aes_elo_seconds', time.perf_counter() - started)
+    metrics.inc('aes_elo_matches_total', len(matches))
     print(f"ELO calculations complete. Calculated ratings for {len(team_elos)} teams.")
     return team_elos
 
+def latest_update(matches, since=0.0):
+    """Latest matches.updated_at among matches rows, or since when none is later"""
+    return max([since] + [m[12] for m in matches if m[12] is not None])
+
+def match_watermark(match):
+    """Chronological sort key of a matches row: (match_time or NO_TIME, matchId)"""
+    return (NO_TIME if match[11] is None else match[11], match[0])
+
+def run_full():
+    """Recompute every rating from scratch and reset the watermark"""
+    delete_elo_table()
+    create_elo_table()
+    create_elo_history_table()
+    create_elo_state_table()
+
+    matches = load_matches()
+    history = []
+    team_elos = process_matches(matches, history=history)
+
+    if matches:
+        save_elo_state(match_watermark(matches[-1]), max(m[0] for m in matches), len(matches),
+                       latest_update(matches), time.time())
+    save_elo_history(history)
+    save_elos_to_database(team_elos)
+
+def run_incremental():
+    """
+    Apply only matches ingested since the last run, on top of the stored ratings.
+    Falls back to a full replay when a new match is dated before the watermark (it would
+    have changed ratings already applied), or when earlier matches were deleted or had
+    their result corrected in place.
+    """
+    create_elo_table()
+    create_elo_history_table()
+    create_elo_state_table()
+
+    state = load_elo_state()
+    if state is None:
+        print("No ELO watermark found, running a full replay")
+        return run_full()
+
+    last_match_time, last_match_id, max_match_id, match_count, matches_updated_at, replayed_at = state
+
+    cursor.execute("SELECT COUNT(*) FROM matches WHERE matchId <= ?", (max_match_id,))
+    if cursor.fetchone()[0] != match_count:
+        print("Previously processed matches changed, running a full replay")
+        return run_full()
+
+    if matches_updated_at is None:
+        print("ELO watermark predates match corrections tracking, running a full replay")
+        return run_full()
+    # The match upsert corrects results in place, keeping the matchId
+    cursor.execute('''
+    SELECT COUNT(*) FROM matches WHERE matchId <= ? AND updated_at > ?
+    ''', (max_match_id, matches_updated_at))
+    corrected = cursor.fetchone()[0]
+    if corrected:
+        print(f"{corrected} previously processed matches were corrected, running a full replay")
+        return run_full()
+
+    matches = load_matches(after_match_id=max_match_id)
+    if not matches:
+        print("No new matches since the last ELO run")
+        return
+
+    if match_watermark(matches[0]) < (last_match_time, last_match_id):
+        print(f"New matches are back-dated before the watermark ({last_match_time}), running a full replay")
+        return run_full()
+
+    # Only teams in the new matches change; start them from their stored ratings
+    team_ids = {m[2] for m in matches} | {m[3] for m in matches}
+    cursor.execute("SELECT team, elo FROM team_elo")
+    stored_elos = {row[0]: row[1] for row in cursor.fetchall() if row[0] in team_ids}
+
+    history = []
+    team_elos = process_matches(matches, stored_elos, history=history, first_seq=match_count)
+
+    save_elo_state(match_watermark(matches[-1]), max(m[0] for m in matches), match_count + len(matches),
+                   latest_update(matches, matches_updated_at), replayed_at)
+    save_elo_history(history)
+    save_elos_to_database(team_elos)
+
 def save_elos_to_database(team_elos):
     """Save calculated ELO ratings to the database"""
     print("Saving ELO ratings to database...")
     
     # Prepare data for batch insert/update
-    elo_data = [(team_id, elo) for team_id, elo in team_elos.items()]
+    now = time.time()
+    elo_data = [(team_id, elo, now) for team_id, elo in team_elos.items()]
     
     # Batch insert or replace all ELO ratings
-    cursor.executemany("INSERT OR REPLACE INTO team_elo (teamId, elo) VALUES (?, ?)", elo_data)
+    cursor.executemany("INSERT OR REPLACE INTO team_elo (team, elo, updated_at) VALUES (?, ?, ?)", elo_data)
     conn.commit()
     
     print(f"Saved {len(elo_data)} ELO ratings to database.")
 
-# Uncomment the line below to delete existing ELO data and start fresh
-delete_elo_table()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calculate team ELO ratings from the matches in vbdatav4.db")
+    parser.add_argument('--full', action='store_true',
+                        help="delete existing ELO data and replay every match from scratch")
+    parser.add_argument('--metrics-jsonl', metavar='PATH', help="append ELO timings to PATH as JSON lines")
+    parser.add_argument('--metrics-textfile', metavar='PATH', help="write ELO metrics as a Prometheus textfile at PATH")
+    args = parser.parse_args()
+
+    metrics.configure(args.metrics_jsonl, args.metrics_textfile)
+    try:
+        # Databases from before the integer ids are migrated (dropping the ELO tables) first,
+        # and the migration leaves the indexes to be built again
+        if schema.upgrade(cursor):
+            schema.create_indexes(cursor)
+        conn.commit()
+        if args.full:
+            run_full()
+        else:
+            run_incremental()
+    finally:
+        metrics.close()
 
-create_elo_table()
-team_elos = process_matches()
-save_elos_to_database(team_elos)
-report_elo_rankings()
+    report_elo_rankings()
 
-conn.close()
\ No newline at end of file
+    conn.close()
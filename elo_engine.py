@@ -0,0 +1,192 @@
+import argparse
+import itertools
+import sqlite3
+import time
+from collections import namedtuple
+
+import numpy as np
+
+# Starting rating as a function of team age: max(floor, base + (age - base_age) * per_year),
+# or `default` when the age is unknown. DEFAULT_CURVE matches elo.get_starting_elo.
+StartingCurve = namedtuple('StartingCurve', ['base', 'per_year', 'floor', 'default', 'base_age'])
+DEFAULT_CURVE = StartingCurve(base=1000, per_year=100, floor=1000, default=1500, base_age=10)
+
+# One parameter set to replay the season with
+EloConfig = namedtuple('EloConfig', ['k', 'curve'])
+DEFAULT_CONFIG = EloConfig(k=32, curve=DEFAULT_CURVE)
+
+
+class Season:
+    """
+    Matches loaded once into contiguous arrays, in the same chronological order elo.py uses.
+    teamId strings are mapped to dense integer indexes, so a replay is pure array work.
+
+    Matches are also grouped into layers: a match's layer is one more than the latest layer of
+    either of its teams, so no team plays twice within a layer and every team's matches stay in
+    chronological order. All matches of a layer can then be applied in one vectorized step with
+    results identical to the match-by-match replay.
+    """
+
+    def __init__(self, team_ids, team_ages, match_ids, team1, team2, result1, layers=None):
+        self.team_ids = team_ids
+        self.team_index = {team_id: i for i, team_id in enumerate(team_ids)}
+        self.team_ages = team_ages
+        self.match_ids = match_ids
+        self.team1 = team1
+        self.team2 = team2
+        self.result1 = result1
+
+        if layers is None:
+            layers = compute_layers(team1, team2, len(team_ids))
+        self.order = np.argsort(layers, kind='stable')
+        sorted_layers = layers[self.order]
+        starts = np.flatnonzero(np.diff(sorted_layers)) + 1
+        bounds = np.concatenate(([0], starts, [len(sorted_layers)]))
+        self.layer_bounds = list(zip(bounds[:-1].tolist(), bounds[1:].tolist())) if len(sorted_layers) else []
+
+        # Layer-ordered copies used by replay()
+        self.layer_team1 = team1[self.order]
+        self.layer_team2 = team2[self.order]
+        self.layer_result1 = result1[self.order]
+
+    def __len__(self):
+        return len(self.match_ids)
+
+
+def compute_layers(team1, team2, n_teams):
+    """Assign each match (in chronological order) the earliest layer after both teams' previous matches"""
+    last = [0] * n_teams
+    layers = np.empty(len(team1), dtype=np.int64)
+    for i, (a, b) in enumerate(zip(team1.tolist(), team2.tolist())):
+        layer = max(last[a], last[b]) + 1
+        layers[i] = layer
+        last[a] = last[b] = layer
+    return layers
+
+
+def load_season(cursor):
+    """Load every match and the ages of the teams that played, ordered as elo.load_matches orders them"""
+    cursor.execute('''
+    SELECT matchId, team1, team2, team2_won
+    FROM matches
+    ORDER BY match_time, matchId
+    ''')
+    rows = cursor.fetchall()
+
+    team_index = {}
+    team1 = np.empty(len(rows), dtype=np.int32)
+    team2 = np.empty(len(rows), dtype=np.int32)
+    result1 = np.empty(len(rows), dtype=np.float64)
+    match_ids = np.empty(len(rows), dtype=np.int64)
+
+    # team_index is keyed on teams.id; the season is indexed by AES teamId like a store's
+    for i, (match_id, team1_key, team2_key, team2_won) in enumerate(rows):
+        match_ids[i] = match_id
+        team1[i] = team_index.setdefault(team1_key, len(team_index))
+        team2[i] = team_index.setdefault(team2_key, len(team_index))
+        result1[i] = 0.0 if team2_won else 1.0
+
+    # Unknown ages are NaN so the starting curve can fall back to its default
+    cursor.execute("SELECT id, teamId, teamAge FROM teams")
+    teams = {key: (team_id, age) for key, team_id, age in cursor.fetchall()}
+    details = [teams.get(key, (None, None)) for key in team_index]
+    team_ids = [team_id for team_id, _ in details]
+    team_ages = np.array([np.nan if age is None else age for _, age in details], dtype=np.float64)
+
+    return Season(team_ids, team_ages, match_ids, team1, team2, result1)
+
+
+def season_from_store(store):
+    """
+    Build the season from a matchstore.MatchStore instead of SQLite: the arrays are already
+    integer-indexed and in replay order, and the layers were computed when the store was built.
+    """
+    n_teams = store.playing_teams
+    ages = np.asarray(store.team_age[:n_teams], dtype=np.float64)
+    ages[ages < 0] = np.nan
+    result1 = 1.0 - np.asarray(store.team2_won, dtype=np.float64)
+    return Season(store.team_ids(playing_only=True), ages, store.match_id, store.team1, store.team2,
+                  result1, layers=store.layer)
+
+
+def starting_ratings(team_ages, curves):
+    """Starting rating of every team under every curve, shape (len(curves), n_teams)"""
+    ratings = np.empty((len(curves), len(team_ages)), dtype=np.float64)
+    unknown = np.isnan(team_ages)
+    for row, curve in zip(ratings, curves):
+        row[:] = np.maximum(curve.floor, curve.base + (team_ages - curve.base_age) * curve.per_year)
+        row[unknown] = curve.default
+    return ratings
+
+
+def replay(season, configs, record_expected=False):
+    """
+    Replay the season under every config at once.
+    Returns final ratings of shape (len(configs), n_teams), indexed like season.team_ids.
+    With record_expected, also returns team1's pre-match expected score for every match,
+    shape (len(configs), n_matches) in chronological order.
+    """
+    k = np.array([config.k for config in configs], dtype=np.float64)[:, None]
+    ratings = starting_ratings(season.team_ages, [config.curve for config in configs])
+    expected = np.empty((len(configs), len(season)), dtype=np.float64) if record_expected else None
+
+    for start, stop in season.layer_bounds:
+        a = season.layer_team1[start:stop]
+        b = season.layer_team2[start:stop]
+        ra = ratings[:, a]
+        rb = ratings[:, b]
+        expected_a = 1.0 / (1.0 + 10.0 ** ((rb - ra) / 400.0))
+        delta = k * (season.layer_result1[start:stop] - expected_a)
+        ratings[:, a] = ra + delta
+        ratings[:, b] = rb - delta
+        if expected is not None:
+            expected[:, season.order[start:stop]] = expected_a
+
+    if record_expected:
+        return ratings, expected
+    return ratings
+
+
+def ratings_dict(season, ratings_row):
+    """Map one config's ratings back to {teamId: elo}, like elo.get_elos_as_of"""
+    return dict(zip(season.team_ids, ratings_row.tolist()))
+
+
+def build_configs(ks, per_years):
+    """Grid of configs over K and the per-year step of the default starting curve"""
+    return [EloConfig(k=k, curve=DEFAULT_CURVE._replace(per_year=per_year))
+            for k, per_year in itertools.product(ks, per_years)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay the season for many ELO parameter sets at once")
+    parser.add_argument('--db', default='vbdatav4.db', help="database to read matches from")
+    parser.add_argument('--store', help="read matches from this matchstore.py directory instead of the database")
+    parser.add_argument('--k', type=float, nargs='+', default=[16, 24, 32, 40, 48],
+                        help="K factors to try")
+    parser.add_argument('--per-year', type=float, nargs='+', default=[50, 100, 150],
+                        help="starting-rating steps per year of team age to try")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.store:
+        from matchstore import MatchStore  # matchstore imports this module
+        season = season_from_store(MatchStore(args.store))
+    else:
+        conn = sqlite3.connect(args.db)
+        season = load_season(conn.cursor())
+        conn.close()
+    load_seconds = time.perf_counter() - start
+    print(f"Loaded {len(season)} matches for {len(season.team_ids)} teams "
+          f"in {load_seconds:.2f}s ({len(season.layer_bounds)} layers)")
+
+    configs = build_configs(args.k, args.per_year)
+    start = time.perf_counter()
+    ratings = replay(season, configs)
+    replay_seconds = time.perf_counter() - start
+    print(f"Replayed {len(configs)} configurations in {replay_seconds:.2f}s")
+
+    for config, row in zip(configs, ratings):
+        best = int(np.argmax(row))
+        print(f"K={config.k:<5g} per_year={config.curve.per_year:<5g} "
+              f"mean={row.mean():7.1f} sd={row.std():6.1f} top={season.team_ids[best]} ({row[best]:.1f})")
@@ -0,0 +1,316 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+
+import metrics
+from httpcache import CacheMiss, endpoint_type
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36",
+    "Accept": "application/json, text/plain, */*",
+}
+
+DEFAULT_CONCURRENCY = 8   # requests in flight at once
+DEFAULT_RATE = 5.0        # requests per second, per host
+DEFAULT_TIMEOUT = 30      # seconds
+DEFAULT_MAX_RATE = 50.0   # ceiling the adaptive controller may raise a host's rate to
+DEFAULT_RETRIES = 4       # further attempts after a failed request
+DEFAULT_RETRY_BACKOFF = 1.0   # seconds before the first retry, doubling for each one after
+MAX_RETRY_BACKOFF = 30.0
+
+# Responses worth asking again for: throttling and transient server errors. Anything else
+# (e.g. 404) is final, as is a response that arrived but could not be parsed.
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second with bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then take it"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        return
+                    delay = (1 - self.tokens) / self.rate
+            time.sleep(delay)
+
+    def _refill(self, now):
+        # During a pause the refill clock is at the pause's end, in the future: nothing is earned
+        # until then, and it must not move back, or the pause would be paid for in tokens again
+        self.tokens = min(self.capacity, self.tokens + max(0.0, now - self.updated) * self.rate)
+        self.updated = max(self.updated, now)
+
+    def set_rate(self, rate):
+        """Change the refill rate; tokens already earned are kept, up to the new burst size"""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+            self.capacity = max(1.0, rate)
+            self.tokens = min(self.tokens, self.capacity)
+
+    def pause(self, seconds):
+        """Hand out no tokens for `seconds`, then resume with an empty bucket"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+            self.tokens = 0.0
+            self.updated = self.paused_until
+
+
+def retry_delay(attempt, backoff=DEFAULT_RETRY_BACKOFF, cap=MAX_RETRY_BACKOFF):
+    """
+    Seconds to wait before retry number `attempt` (1, 2, ...): exponential backoff with jitter.
+    Half the delay is fixed and half random, so workers that failed together spread out.
+    """
+    delay = min(cap, backoff * 2 ** (attempt - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def parse_retry_after(value):
+    """Seconds to wait from a Retry-After header (delay-seconds or an HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRate:
+    """
+    AIMD controller for one host's token bucket. Until the first cut the rate doubles about
+    every second (slow start); after that every fast successful response adds about
+    `increase` requests/second per second of crawling, up to max_rate. A 429 or 5xx response,
+    or a smoothed latency over `latency_factor` times the baseline latency, multiplies the
+    rate by `decrease` (down to min_rate). Latency must also be `min_latency_rise` seconds
+    over the baseline, so jitter on a fast server is not taken for load. Responses still in flight when the rate was cut
+    report the same overload, so at most one cut is made per smoothed round trip.
+    Retry-After pauses the bucket for as long as the server asks.
+    """
+
+    def __init__(self, bucket, max_rate=DEFAULT_MAX_RATE, min_rate=0.5, increase=1.0, decrease=0.5,
+                 latency_factor=2.0, min_latency_rise=0.05, smoothing=0.2, base_drift=0.01):
+        self.bucket = bucket
+        self.max_rate = max(max_rate, bucket.rate)
+        self.min_rate = min(min_rate, bucket.rate)
+        self.increase = increase
+        self.decrease = decrease
+        self.latency_factor = latency_factor
+        self.min_latency_rise = min_latency_rise
+        self.smoothing = smoothing
+        self.base_drift = base_drift
+        self.latency = None       # exponentially smoothed latency
+        self.base_latency = None  # the server's unloaded response time: the lowest latency seen, drifting
+                                  # slowly towards the smoothed latency so a lasting change is accepted
+        self.last_cut = 0.0
+        self.slow_start = True
+        self.lock = threading.Lock()
+
+    def observe(self, latency, status_code=None, retry_after=None):
+        """Adjust the rate after a response (status_code None: no response, e.g. a timeout)"""
+        now = time.monotonic()
+        with self.lock:
+            if retry_after:
+                self.bucket.pause(retry_after)
+
+            overloaded = status_code is None or status_code == 429 or status_code >= 500
+            if not overloaded:
+                self.latency = latency if self.latency is None else (
+                    self.latency + self.smoothing * (latency - self.latency))
+                if self.base_latency is None:
+                    self.base_latency = latency
+                else:
+                    self.base_latency = min(latency, self.base_latency + self.base_drift * (self.latency - self.base_latency))
+
+            if overloaded:
+                reason = 'status'
+            elif self.latency > max(self.latency_factor * self.base_latency,
+                                    self.base_latency + self.min_latency_rise):
+                reason = 'latency'
+            else:
+                rate = self.bucket.rate
+                if rate < self.max_rate:
+                    step = 1.0 if self.slow_start else self.increase / rate
+                    self.bucket.set_rate(min(self.max_rate, rate + step))
+                return
+
+            if now - self.last_cut < (self.latency or 0.0):
+                return
+            self.last_cut = now
+            self.slow_start = False
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate * self.decrease))
+            # Start the smoothed latency over, so the next cut needs fresh evidence of load
+            if reason == 'latency':
+                self.latency = self.base_latency
+        metrics.inc('aes_rate_backoffs_total', reason=reason)
+
+
+class Fetcher:
+    """
+    Bounded thread-pool HTTP fetcher with a token-bucket rate limit per host.
+    Responses are handed back to the calling thread, so the caller can keep
+    all database writes on a single connection while requests overlap. However many
+    threads call get(), at most `concurrency` requests are on the network at once.
+
+    Unless adaptive=False, `rate` is only the starting rate: each host's AdaptiveRate
+    raises it while responses stay fast and cuts it on overload. Failed requests (no
+    response, or a RETRY_STATUSES response) are retried up to `retries` times, after
+    retry_delay() and any pause the host asked for.
+
+    With a ResponseCache, fresh cache hits are served without touching the network
+    (or the rate limiter). In replay mode every URL must come from the cache.
+    """
+
+    def __init__(self, concurrency=DEFAULT_CONCURRENCY, rate=DEFAULT_RATE, timeout=DEFAULT_TIMEOUT,
+                 cache=None, replay=False, adaptive=True, max_rate=DEFAULT_MAX_RATE,
+                 retries=DEFAULT_RETRIES, retry_backoff=DEFAULT_RETRY_BACKOFF):
+        if replay and cache is None:
+            raise ValueError("replay mode requires a response cache")
+        self.concurrency = concurrency
+        self.in_flight = threading.BoundedSemaphore(concurrency)
+        self.rate = rate
+        self.adaptive = adaptive
+        self.max_rate = max_rate
+        self.retries = retries
+        self.retry_backoff = retry_backoff
+        self.timeout = timeout
+        self.cache = cache
+        self.replay = replay
+        self.buckets = {}
+        self.controllers = {}
+        self.buckets_lock = threading.Lock()
+        self.local = threading.local()
+
+    def _bucket(self, url):
+        """The host's token bucket and its AdaptiveRate (None with adaptive=False)"""
+        host = urlsplit(url).netloc
+        with self.buckets_lock:
+            bucket = self.buckets.get(host)
+            if bucket is None:
+                bucket = self.buckets[host] = TokenBucket(self.rate)
+                if self.adaptive:
+                    self.controllers[host] = AdaptiveRate(bucket, self.max_rate)
+            return bucket, self.controllers.get(host)
+
+    def rates(self):
+        """Current requests/second allowed per host"""
+        with self.buckets_lock:
+            return {host: bucket.rate for host, bucket in self.buckets.items()}
+
+    def _session(self):
+        # requests.Session is not thread-safe, so each worker thread keeps its own
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = self.local.session = requests.Session()
+            session.headers.update(HEADERS)
+        return session
+
+    def get(self, url, fresh=False):
+        """
+        Fetch a single URL from the cache, or from the network after waiting for the host's rate limiter.
+        fresh=True skips the cache lookup (the new response is still cached).
+        """
+        endpoint = endpoint_type(url)
+        if self.cache is not None and not fresh:
+            cached = self.cache.get(url, ignore_ttl=self.replay)
+            if cached is not None:
+                metrics.inc('aes_cache_hits_total', endpoint=endpoint)
+                return cached
+            if self.replay:
+                raise CacheMiss(f"not in cache: {url}")
+
+        bucket, controller = self._bucket(url)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                time.sleep(retry_delay(attempt, self.retry_backoff))
+            try:
+                # Every stage's workers share the one cap on requests in flight
+                with self.in_flight:
+                    bucket.acquire()
+                    start = time.perf_counter()
+                    response = self._session().get(url, timeout=self.timeout)
+            except Exception:
+                metrics.inc('aes_responses_total', endpoint=endpoint, status='error')
+                if controller is not None:
+                    controller.observe(time.perf_counter() - start)
+                if attempt == self.retries:
+                    raise
+                metrics.inc('aes_retries_total', endpoint=endpoint, reason='error')
+                continue
+            latency = time.perf_counter() - start
+            metrics.observe('aes_request_seconds', latency, endpoint=endpoint)
+            metrics.inc('aes_responses_total', endpoint=endpoint, status=response.status_code)
+            metrics.inc('aes_response_bytes_total', len(response.content), endpoint=endpoint)
+
+            retry_after = parse_retry_after(response.headers.get('Retry-After'))
+            if controller is not None:
+                controller.observe(latency, response.status_code, retry_after)
+            elif retry_after:
+                bucket.pause(retry_after)
+
+            if response.status_code not in RETRY_STATUSES or attempt == self.retries:
+                break
+            metrics.inc('aes_retries_total', endpoint=endpoint, reason=response.status_code)
+
+        if self.cache is not None:
+            self.cache.put(url, response)
+        return response
+
+    def discard(self, url):
+        """Forget the cached response for url, unless replaying: the cache is all a replay has"""
+        if self.cache is not None and not self.replay:
+            self.cache.discard(url)
+
+    def _fetch(self, url):
+        try:
+            return url, self.get(url), None
+        except Exception as e:
+            return url, None, e
+
+    def fetch_all(self, urls):
+        """
+        Fetch urls concurrently and yield (url, response, error) tuples in completion order.
+        At most 2x concurrency requests are queued at once, so a slow consumer
+        applies backpressure instead of letting responses pile up in memory.
+        """
+        urls = iter(urls)
+        window = self.concurrency * 2
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            for url in urls:
+                pending.add(pool.submit(self._fetch, url))
+                if len(pending) >= window:
+                    break
+
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+                for url in urls:
+                    pending.add(pool.submit(self._fetch, url))
+                    if len(pending) >= window:
+                        break
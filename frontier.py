@@ -0,0 +1,252 @@
+import os
+import socket
+import time
+
+# Crawl stages, in the order they run
+STAGE_EVENT = 'event'
+STAGE_DIVISION = 'division'
+STAGE_MATCH = 'match'
+
+# A claim older than this is assumed to belong to a dead worker and may be re-claimed
+DEFAULT_LEASE_SECONDS = 600
+
+
+def default_worker_id():
+    """Identify this worker process across hosts sharing the same database file"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def create_frontier_table(cursor):
+    """Create the crawl frontier: one row per URL to fetch, tracked through to done/skipped/failed"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS frontier (
+        url TEXT PRIMARY KEY,
+        stage TEXT NOT NULL,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        last_error TEXT,
+        claimed_by TEXT,
+        claimed_at REAL,
+        updated_at REAL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_frontier_stage_status ON frontier(stage, status)')
+
+    # URLs that still failed after the fetcher's retries, kept until a --retry-failed run recovers them.
+    # failures counts the runs that gave up on the url.
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS dead_letters (
+        url TEXT PRIMARY KEY,
+        stage TEXT NOT NULL,
+        failures INTEGER NOT NULL DEFAULT 1,
+        last_error TEXT,
+        first_failed_at REAL,
+        last_failed_at REAL
+    )
+    ''')
+
+
+def enqueue(cursor, stage, urls, claimed_by=None):
+    """
+    Add urls to a stage. URLs already in the frontier are left untouched, so work
+    completed by an earlier run is never redone. With claimed_by the urls are inserted
+    already claimed by that worker, for work it hands straight to its own next stage.
+    Does not commit: callers commit together with the rows that produced the urls.
+    """
+    now = time.time()
+    if claimed_by is None:
+        cursor.executemany('''
+        INSERT OR IGNORE INTO frontier (url, stage, status, updated_at)
+        VALUES (?, ?, 'pending', ?)
+        ''', [(url, stage, now) for url in urls])
+    else:
+        cursor.executemany('''
+        INSERT OR IGNORE INTO frontier (url, stage, status, attempts, claimed_by, claimed_at, updated_at)
+        VALUES (?, ?, 'in_progress', 1, ?, ?, ?)
+        ''', [(url, stage, claimed_by, now, now) for url in urls])
+
+
+def requeue(cursor, stage, urls, claimed_by):
+    """
+    Put urls back into a stage claimed by claimed_by, whatever their current status,
+    for work that must be redone (e.g. a schedule whose team has new results). Not committed.
+    """
+    now = time.time()
+    cursor.executemany('''
+    INSERT INTO frontier (url, stage, status, attempts, claimed_by, claimed_at, updated_at)
+    VALUES (?, ?, 'in_progress', 1, ?, ?, ?)
+    ON CONFLICT (url) DO UPDATE SET
+        status = 'in_progress', attempts = attempts + 1, last_error = NULL,
+        claimed_by = excluded.claimed_by, claimed_at = excluded.claimed_at, updated_at = excluded.updated_at
+    ''', [(url, stage, claimed_by, now, now) for url in urls])
+
+
+def claim(conn, stage, worker_id, limit, lease_seconds=DEFAULT_LEASE_SECONDS, started_at=0.0):
+    """
+    Atomically claim up to `limit` pending urls of a stage for worker_id and return them.
+    Claims whose lease has expired are treated as pending again, except worker_id's own
+    claims made since started_at: those are urls this process still holds in a stage queue
+    or a division plan, however long they wait there. Commits any open transaction on conn
+    first, so call this between batches.
+    """
+    conn.commit()
+    now = time.time()
+    cursor = conn.cursor()
+
+    # BEGIN IMMEDIATE takes the write lock up front, so two workers can never claim the same rows
+    cursor.execute('BEGIN IMMEDIATE')
+    try:
+        cursor.execute('''
+        UPDATE frontier
+        SET status = 'in_progress', claimed_by = ?, claimed_at = ?, updated_at = ?, attempts = attempts + 1
+        WHERE url IN (
+            SELECT url FROM frontier
+            WHERE stage = ?
+              AND (status = 'pending'
+                   OR (status = 'in_progress' AND claimed_at < ?
+                       AND NOT (claimed_by = ? AND claimed_at >= ?)))
+            ORDER BY rowid
+            LIMIT ?
+        )
+        ''', (worker_id, now, now, stage, now - lease_seconds, worker_id, started_at, limit))
+
+        cursor.execute('''
+        SELECT url FROM frontier
+        WHERE stage = ? AND status = 'in_progress' AND claimed_by = ? AND claimed_at = ?
+        ORDER BY rowid
+        ''', (stage, worker_id, now))
+        urls = [row[0] for row in cursor.fetchall()]
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+    return urls
+
+
+def mark_done(cursor, url):
+    """Mark a url as finished (not committed)"""
+    cursor.execute('''
+    UPDATE frontier SET status = 'done', last_error = NULL, updated_at = ? WHERE url = ?
+    ''', (time.time(), url))
+
+
+def mark_skipped(cursor, url):
+    """Mark a url as not needing a fetch, e.g. a schedule already covered by opponents (not committed)"""
+    cursor.execute('''
+    UPDATE frontier SET status = 'skipped', last_error = NULL, updated_at = ? WHERE url = ?
+    ''', (time.time(), url))
+
+
+def mark_failed(cursor, url, error):
+    """Mark a url as failed, record why, and add it to the dead letters (not committed)"""
+    now = time.time()
+    cursor.execute('''
+    UPDATE frontier SET status = 'failed', last_error = ?, updated_at = ? WHERE url = ?
+    ''', (str(error), now, url))
+    cursor.execute('''
+    INSERT INTO dead_letters (url, stage, last_error, first_failed_at, last_failed_at)
+    SELECT url, stage, last_error, updated_at, updated_at FROM frontier WHERE url = ?
+    ON CONFLICT (url) DO UPDATE SET
+        failures = failures + 1, last_error = excluded.last_error, last_failed_at = excluded.last_failed_at
+    ''', (url,))
+
+
+def requeue_dead_letters(conn):
+    """
+    Return every dead-lettered url to pending in its frontier stage, for a --retry-failed run
+    to claim. The dead letters stay until clear_recovered() sees the url done.
+    Returns {stage: urls requeued}.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+    UPDATE frontier SET status = 'pending', claimed_by = NULL, updated_at = ?
+    WHERE url IN (SELECT url FROM dead_letters)
+    ''', (time.time(),))
+    cursor.execute('''
+    SELECT f.stage, COUNT(*) FROM dead_letters d JOIN frontier f ON f.url = d.url
+    WHERE f.status = 'pending' GROUP BY f.stage
+    ''')
+    counts = dict(cursor.fetchall())
+    conn.commit()
+    return counts
+
+
+def clear_recovered(conn):
+    """Delete the dead letters whose url has since been fetched (done or skipped); returns how many"""
+    cursor = conn.cursor()
+    cursor.execute('''
+    DELETE FROM dead_letters
+    WHERE url IN (SELECT url FROM frontier WHERE status IN ('done', 'skipped'))
+    ''')
+    conn.commit()
+    return cursor.rowcount
+
+
+def dead_letter_urls(cursor):
+    cursor.execute("SELECT url FROM dead_letters")
+    return [row[0] for row in cursor.fetchall()]
+
+
+def dead_letter_count(cursor):
+    cursor.execute("SELECT COUNT(*) FROM dead_letters")
+    return cursor.fetchone()[0]
+
+
+def release_claims(conn, stage=None):
+    """Return every in-progress url (optionally of one stage) to pending, e.g. after a crash"""
+    cursor = conn.cursor()
+    if stage is None:
+        cursor.execute("UPDATE frontier SET status = 'pending', claimed_by = NULL WHERE status = 'in_progress'")
+    else:
+        cursor.execute('''
+        UPDATE frontier SET status = 'pending', claimed_by = NULL
+        WHERE status = 'in_progress' AND stage = ?
+        ''', (stage,))
+    conn.commit()
+    return cursor.rowcount
+
+
+def process_alive(pid):
+    """Whether a process with this pid (text, from a worker id) is running on this host; unknown counts as alive"""
+    try:
+        pid = int(pid)
+    except ValueError:
+        return True
+    if pid == os.getpid() or os.name == 'nt':  # os.kill would terminate a Windows process
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        return True
+    return True
+
+
+def release_dead_claims(conn):
+    """
+    Return to pending the in-progress urls claimed by worker processes on this host that are
+    no longer running, so a run restarted right after a crash does not wait for their lease.
+    Claims from other hosts, or under a custom --worker-id, still wait for it. Returns how many.
+    """
+    prefix = socket.gethostname() + ':'
+    cursor = conn.cursor()
+    cursor.execute("SELECT DISTINCT claimed_by FROM frontier WHERE status = 'in_progress'")
+    dead = [worker for (worker,) in cursor.fetchall()
+            if worker and worker.startswith(prefix) and not process_alive(worker[len(prefix):])]
+    now = time.time()
+    cursor.executemany('''
+    UPDATE frontier SET status = 'pending', claimed_by = NULL, updated_at = ?
+    WHERE status = 'in_progress' AND claimed_by = ?
+    ''', [(now, worker) for worker in dead])
+    conn.commit()
+    return cursor.rowcount if dead else 0
+
+
+def remaining(cursor, stage):
+    """Count urls of a stage still waiting to be fetched"""
+    cursor.execute('''
+    SELECT COUNT(*) FROM frontier WHERE stage = ? AND status IN ('pending', 'in_progress')
+    ''', (stage,))
+    return cursor.fetchone()[0]
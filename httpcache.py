@@ -0,0 +1,108 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_CACHE_DIR = 'http_cache'
+
+# Seconds before a cached response goes stale, by endpoint type. None = never expires.
+# Landing pages list events and change daily; past-event data is final once the event is over.
+ENDPOINT_TTLS = {
+    'landing': 6 * 3600,
+    'event': None,
+    'standings': None,
+    'schedule': None,
+    'other': 3600,
+}
+
+
+def endpoint_type(url):
+    """Classify an AES URL so it can be given the right TTL"""
+    if '/api/landing/' in url:
+        return 'landing'
+    if '/standings(' in url:
+        return 'standings'
+    if url.endswith('/schedule/past'):
+        return 'schedule'
+    if '/api/event/' in url:
+        return 'event'
+    return 'other'
+
+
+class CacheMiss(Exception):
+    """Raised in replay mode when a URL has no usable cached response"""
+
+
+class CachedResponse:
+    """Minimal stand-in for requests.Response built from a cache entry"""
+
+    def __init__(self, url, status_code, content, fetched_at):
+        self.url = url
+        self.status_code = status_code
+        self.content = content
+        self.fetched_at = fetched_at
+        self.headers = {}
+        self.from_cache = True
+
+    def json(self):
+        return json.loads(self.content)
+
+
+class ResponseCache:
+    """
+    Content-addressed on-disk cache of successful responses.
+    Each entry lives at <cache_dir>/<sha[:2]>/<sha256(url)> as a JSON header line
+    (url, status, fetch time) followed by the raw response body.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttls=None):
+        self.cache_dir = cache_dir
+        self.ttls = dict(ENDPOINT_TTLS, **(ttls or {}))
+
+    def _path(self, url):
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def get(self, url, ignore_ttl=False):
+        """Return a CachedResponse for url, or None if missing or expired"""
+        try:
+            with open(self._path(url), 'rb') as f:
+                header = json.loads(f.readline())
+                content = f.read()
+        except (OSError, ValueError):
+            return None
+
+        # Guard against the (practically impossible) hash collision
+        if header.get('url') != url:
+            return None
+
+        ttl = self.ttls.get(endpoint_type(url))
+        if not ignore_ttl and ttl is not None and time.time() - header['fetched_at'] > ttl:
+            return None
+
+        return CachedResponse(url, header['status'], content, header['fetched_at'])
+
+    def put(self, url, response):
+        """Store a successful response body; other status codes are not cached"""
+        if response.status_code != 200:
+            return
+
+        path = self._path(url)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        header = json.dumps({'url': url, 'status': response.status_code, 'fetched_at': time.time()})
+
+        # Write to a temp file and rename so concurrent readers never see a partial entry
+        tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(header.encode('utf-8'))
+            f.write(b'\n')
+            f.write(response.content)
+        os.replace(tmp_path, path)
+
+    def discard(self, url):
+        """Drop the entry for url, e.g. a 200 body that would not parse, so it is fetched again"""
+        try:
+            os.remove(self._path(url))
+        except OSError:
+            pass
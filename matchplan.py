@@ -0,0 +1,94 @@
+import threading
+
+DEFAULT_MAX_ACTIVE_PLANS = 200  # divisions whose schedules may be in progress at once
+
+
+class DivisionPlan:
+    """
+    Orders the team schedule fetches for one division.
+    Every match appears in both teams' schedule/past responses, so once the matches seen
+    in opponents' schedules add up to a team's matchesWon + matchesLost from the standings,
+    its own schedule has nothing new and is skipped. A team without a record in the
+    standings (expected None) is never skipped. Teams are fetched one at a time, always
+    picking the team with the most matches not yet seen (unknown counts as most), so each
+    response covers as much of the division as possible.
+    """
+
+    def __init__(self, teams):
+        # teams: iterable of (teamId, schedule url, matches played per the standings, or None)
+        self.urls = {}
+        self.expected = {}
+        self.seen = {}
+        for team_id, url, expected in teams:
+            self.urls[team_id] = url
+            self.expected[team_id] = expected
+            self.seen[team_id] = set()
+        self.unfetched = set(self.urls)
+        self.in_flight = 0
+        self.lock = threading.Lock()
+
+    def record(self, matches):
+        """Note (match key, team1_id, team2_id) tuples read from a fetched schedule"""
+        with self.lock:
+            for key, team1_id, team2_id in matches:
+                for team_id in (team1_id, team2_id):
+                    seen = self.seen.get(team_id)
+                    if seen is not None:
+                        seen.add(key)
+
+    def advance(self, finished=False):
+        """
+        Pick the next schedule to fetch, after a fetch has finished (finished=True) or to start.
+        Returns (url to fetch or None, urls skipped as already covered, whether the plan is complete).
+        """
+        with self.lock:
+            if finished:
+                self.in_flight -= 1
+
+            covered = [team_id for team_id in self.unfetched
+                       if self.expected[team_id] is not None
+                       and len(self.seen[team_id]) >= self.expected[team_id]]
+            for team_id in covered:
+                self.unfetched.remove(team_id)
+            skipped = [self.urls[team_id] for team_id in covered]
+
+            next_url = None
+            if self.in_flight == 0 and self.unfetched:
+                team_id = max(self.unfetched, key=self._unseen)
+                self.unfetched.remove(team_id)
+                self.in_flight += 1
+                next_url = self.urls[team_id]
+
+            done = not self.unfetched and self.in_flight == 0
+            return next_url, skipped, done
+
+
+    def _unseen(self, team_id):
+        expected = self.expected[team_id]
+        return float('inf') if expected is None else expected - len(self.seen[team_id])
+
+
+class PlanLimiter:
+    """Caps the number of divisions with schedules in progress, so plans cannot pile up in memory"""
+
+    def __init__(self, limit=DEFAULT_MAX_ACTIVE_PLANS):
+        self.limit = limit
+        self.active = 0
+        self.cond = threading.Condition()
+
+    def acquire(self):
+        with self.cond:
+            while self.active >= self.limit:
+                self.cond.wait()
+            self.active += 1
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify_all()
+
+    def wait_idle(self):
+        """Block until every plan has finished"""
+        with self.cond:
+            while self.active:
+                self.cond.wait()
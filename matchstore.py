@@ -0,0 +1,230 @@
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import time
+from datetime import datetime
+
+import numpy as np
+
+from elo_engine import compute_layers
+
+DEFAULT_STORE_DIR = 'match_store'
+STORE_VERSION = 1
+FETCH_SIZE = 10000
+
+NO_TIME = np.iinfo(np.int64).min  # epoch seconds of a match without a start time
+NO_SCORE = -1                     # set score that was not played / not reported
+NO_STRING = -1                    # string table index of a NULL name
+NO_AGE = -1
+
+# Every array of the store, one .npy file each
+MATCH_ARRAYS = ['match_id', 'team1', 'team2', 'team2_won', 'epoch', 'scores', 'bracket', 'layer']
+TEAM_ARRAYS = ['team_id', 'team_name', 'club_name', 'team_age']
+STRING_ARRAYS = ['string_offsets', 'string_data']
+
+
+class StringTable:
+    """Collects distinct strings while building; stored as one UTF-8 blob plus offsets"""
+
+    def __init__(self):
+        self.index = {}
+
+    def add(self, value):
+        if value is None:
+            return NO_STRING
+        return self.index.setdefault(value, len(self.index))
+
+    def arrays(self):
+        encoded = [value.encode('utf-8') for value in self.index]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(value) for value in encoded], out=offsets[1:])
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        return offsets, data
+
+
+def build_store(db_path, store_dir=DEFAULT_STORE_DIR):
+    """
+    Compile the matches and teams tables into a store directory of fixed-width arrays.
+    Matches keep elo.load_matches order; teams that played come first (in order of their
+    first match, as elo_engine.load_season indexes them), followed by teams without matches.
+    The store is written beside the old one and swapped in when complete.
+    """
+    conn = sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+    cursor = conn.cursor()
+
+    cursor.execute("SELECT COUNT(*), MAX(matchId), MAX(updated_at) FROM matches")
+    n_matches, max_match_id, matches_updated_at = cursor.fetchone()
+
+    strings = StringTable()
+    team_index = {}
+    arrays = {
+        'match_id': np.empty(n_matches, dtype=np.int64),
+        'team1': np.empty(n_matches, dtype=np.int32),
+        'team2': np.empty(n_matches, dtype=np.int32),
+        'team2_won': np.empty(n_matches, dtype=np.int8),
+        'epoch': np.empty(n_matches, dtype=np.int64),
+        'scores': np.empty((n_matches, 6), dtype=np.int16),
+        'bracket': np.empty(n_matches, dtype=np.int32),
+    }
+
+    cursor.execute('''
+    SELECT matchId, bracket, team1, team2, team2_won,
+           set1_team1_score, set1_team2_score, set2_team1_score, set2_team2_score,
+           set3_team1_score, set3_team2_score, match_time
+    FROM matches
+    ORDER BY match_time, matchId
+    ''')
+    i = 0
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for match_id, bracket, team1_key, team2_key, team2_won, *rest in rows:
+            *scores, match_time = rest
+            arrays['match_id'][i] = match_id
+            arrays['team1'][i] = team_index.setdefault(team1_key, len(team_index))
+            arrays['team2'][i] = team_index.setdefault(team2_key, len(team_index))
+            arrays['team2_won'][i] = 1 if team2_won else 0
+            arrays['epoch'][i] = NO_TIME if match_time is None else match_time
+            arrays['scores'][i] = [NO_SCORE if score is None else score for score in scores]
+            arrays['bracket'][i] = strings.add(bracket)
+            i += 1
+    n_playing = len(team_index)
+
+    # team_index is keyed on teams.id; the store keeps the AES teamId strings
+    cursor.execute("SELECT id, teamId, teamName, clubName, teamAge FROM teams")
+    details = {key: (team_id, name, club, age) for key, team_id, name, club, age in cursor.fetchall()}
+    for key in details:
+        team_index.setdefault(key, len(team_index))
+    conn.close()
+
+    team_keys = list(team_index)
+    columns = {'team_id': [], 'team_name': [], 'club_name': [], 'team_age': []}
+    for key in team_keys:
+        team_id, name, club, age = details.get(key, (None, None, None, None))
+        columns['team_id'].append(strings.add(team_id))
+        columns['team_name'].append(strings.add(name))
+        columns['club_name'].append(strings.add(club))
+        columns['team_age'].append(NO_AGE if age is None else age)
+    for name, values in columns.items():
+        arrays[name] = np.array(values, dtype=np.int16 if name == 'team_age' else np.int32)
+    arrays['string_offsets'], arrays['string_data'] = strings.arrays()
+
+    arrays['layer'] = compute_layers(arrays['team1'], arrays['team2'], n_playing).astype(np.int32)
+
+    meta = {
+        'version': STORE_VERSION,
+        'source': os.path.abspath(db_path),
+        'built_at': datetime.now().isoformat(timespec='seconds'),
+        'matches': n_matches,
+        'max_match_id': max_match_id,
+        'matches_updated_at': matches_updated_at,
+        'teams': len(team_keys),
+        'playing_teams': n_playing,
+    }
+
+    tmp_dir = store_dir.rstrip(os.sep) + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_dir, f'{name}.npy'), array)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(store_dir, ignore_errors=True)
+    os.replace(tmp_dir, store_dir)
+    return meta
+
+
+class MatchStore:
+    """
+    Read side of a store: every array is memory-mapped, so opening costs a few file maps
+    and scans touch only the pages they read. Strings are decoded on demand.
+    """
+
+    def __init__(self, store_dir=DEFAULT_STORE_DIR):
+        self.store_dir = store_dir
+        with open(os.path.join(store_dir, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if self.meta['version'] != STORE_VERSION:
+            raise ValueError(f"{store_dir} is store version {self.meta['version']}, expected {STORE_VERSION}; rebuild it")
+        for name in MATCH_ARRAYS + TEAM_ARRAYS + STRING_ARRAYS:
+            setattr(self, name, np.load(os.path.join(store_dir, f'{name}.npy'), mmap_mode='r'))
+        self.playing_teams = self.meta['playing_teams']
+
+    def __len__(self):
+        return len(self.match_id)
+
+    def string(self, index):
+        """Decode one entry of the string table (None for NO_STRING)"""
+        if index == NO_STRING:
+            return None
+        start, stop = self.string_offsets[index], self.string_offsets[index + 1]
+        return self.string_data[start:stop].tobytes().decode('utf-8')
+
+    def team_ids(self, playing_only=False):
+        """teamId strings by team index"""
+        count = self.playing_teams if playing_only else len(self.team_id)
+        return [self.string(i) for i in self.team_id[:count].tolist()]
+
+    def is_current(self, cursor):
+        """
+        Whether the store still matches the database's matches table: its count, highest matchId
+        and latest updated_at, which a result corrected in place moves (as elo.run_incremental checks)
+        """
+        cursor.execute("SELECT COUNT(*), MAX(matchId), MAX(updated_at) FROM matches")
+        return cursor.fetchone() == (self.meta['matches'], self.meta['max_match_id'],
+                                     self.meta.get('matches_updated_at'))
+
+
+def team_records(store):
+    """Matches and sets won and lost by every team, as arrays indexed like store.team_id"""
+    n_teams = len(store.team_id)
+    team2_won = np.asarray(store.team2_won, dtype=bool)
+    winners = np.where(team2_won, store.team2, store.team1)
+    losers = np.where(team2_won, store.team1, store.team2)
+
+    scores = np.asarray(store.scores)
+    played = (scores[:, 0::2] != NO_SCORE) & (scores[:, 1::2] != NO_SCORE)
+    sets1 = ((scores[:, 0::2] > scores[:, 1::2]) & played).sum(axis=1)
+    sets2 = ((scores[:, 1::2] > scores[:, 0::2]) & played).sum(axis=1)
+
+    return {
+        'matchesWon': np.bincount(winners, minlength=n_teams),
+        'matchesLost': np.bincount(losers, minlength=n_teams),
+        'setsWon': np.bincount(store.team1, sets1, n_teams) + np.bincount(store.team2, sets2, n_teams),
+        'setsLost': np.bincount(store.team1, sets2, n_teams) + np.bincount(store.team2, sets1, n_teams),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compile matches and teams into a memory-mapped binary store")
+    parser.add_argument('--db', default='vbdatav4.db', help="database to read from")
+    parser.add_argument('--store', default=DEFAULT_STORE_DIR, help="store directory to write")
+    parser.add_argument('--info', action='store_true', help="describe the existing store instead of rebuilding it")
+    args = parser.parse_args()
+
+    if not args.info:
+        start = time.perf_counter()
+        meta = build_store(args.db, args.store)
+        print(f"Built {args.store}: {meta['matches']} matches, {meta['teams']} teams "
+              f"in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    store = MatchStore(args.store)
+    open_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    records = team_records(store)
+    scan_seconds = time.perf_counter() - start
+
+    size = sum(os.path.getsize(os.path.join(args.store, name)) for name in os.listdir(args.store))
+    print(f"{args.store}: {len(store)} matches, {len(store.team_id)} teams, {size / 1e6:.1f} MB, built {store.meta['built_at']}")
+    print(f"Opened in {open_seconds * 1000:.1f}ms; team records from every match in {scan_seconds * 1000:.1f}ms")
+
+    conn = sqlite3.connect(args.db)
+    if not store.is_current(conn.cursor()):
+        print("The database has changed since the store was built; rebuild it")
+    conn.close()
@@ -0,0 +1,199 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+
+# Seconds; covers cache hits through slow API responses and large commits
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DEFAULT_INTERVAL = 15.0  # seconds between Prometheus textfile rewrites
+
+HELP = {
+    'aes_request_seconds': "HTTP request latency by endpoint (network fetches only)",
+    'aes_responses_total': "HTTP responses by endpoint and status code ('error' when no response arrived)",
+    'aes_response_bytes_total': "Response body bytes downloaded by endpoint",
+    'aes_rate_backoffs_total': "Cuts of a host's request rate by the adaptive controller, by cause (status or latency)",
+    'aes_retries_total': "Requests retried after a 429/5xx response or no response ('error'), by endpoint and reason",
+    'aes_dead_letters_total': "URLs written to the dead_letters table, by stage",
+    'aes_cache_hits_total': "Responses served from the on-disk cache by endpoint",
+    'aes_parse_seconds': "JSON decoding and row building per response, by stage",
+    'aes_rows_total': "Rows parsed and handed to the writer, by stage and table",
+    'aes_event_keys_total': "Event keys listed on the landing pages, by whether they were new",
+    'aes_stage_seconds': "Wall time of the landing-page listing, and from the start of the pipeline until each stage finished",
+    'aes_commit_seconds': "Duration of each writer transaction commit",
+    'aes_commits_total': "Writer transactions committed",
+    'aes_rows_written_total': "Rows changed in the database by the writer",
+    'aes_checkpoint_seconds': "Duration of each explicit WAL checkpoint during a bulk load",
+    'aes_index_seconds': "Duration of de-duplicating matches and building the indexes after a bulk load",
+    'aes_writer_busy_seconds_total': "Seconds the writer thread spent applying writes and committing",
+    'aes_dedupe_seconds': "Duration of remove_duplicate_matches",
+    'aes_duplicates_removed_total': "Duplicate matches deleted by remove_duplicate_matches",
+    'aes_elo_seconds': "Duration of elo.process_matches",
+    'aes_elo_matches_total': "Matches applied by elo.process_matches",
+    'aes_rank_request_seconds': "Time rankserver.py took to answer a request, by endpoint",
+    'aes_rank_load_seconds': "Duration of each load of the rankings service's in-memory index",
+    'aes_rank_reloads_total': "Index reloads by the rankings service after an ELO run finished",
+}
+
+# Disabled until configure(): every call then returns at once, so instrumented code pays one
+# global lookup. Once enabled, histogram observations are appended to a JSON lines file as they
+# happen, and every metric is rewritten as a Prometheus textfile (for node_exporter's textfile
+# collector) periodically and on close().
+enabled = False
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> [per-bucket counts..., +Inf count], sum
+_jsonl = None
+_textfile_path = None
+_stop = None
+_writer_thread = None
+
+
+def configure(jsonl_path=None, textfile_path=None, interval=DEFAULT_INTERVAL):
+    """Enable collection; with neither path given, metrics stay disabled"""
+    global enabled, _jsonl, _textfile_path, _stop, _writer_thread
+    if not jsonl_path and not textfile_path:
+        return
+    _jsonl = open(jsonl_path, 'a', encoding='utf-8', buffering=1) if jsonl_path else None
+    _textfile_path = textfile_path
+    enabled = True
+
+    if textfile_path and interval:
+        _stop = threading.Event()
+        _writer_thread = threading.Thread(target=_write_periodically, args=(interval,),
+                                          name='metrics-textfile', daemon=True)
+        _writer_thread.start()
+
+
+def _key(name, labels):
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    """Add to a counter"""
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, value, **labels):
+    """Record one histogram observation, and append it to the JSON lines file"""
+    if not enabled:
+        return
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * (len(DEFAULT_BUCKETS) + 1), 0.0]
+        histogram[0][bisect.bisect_left(DEFAULT_BUCKETS, value)] += 1
+        histogram[1] += value
+        if _jsonl is not None:
+            _jsonl.write(json.dumps({'ts': time.time(), 'metric': name, 'value': value, **labels}) + '\n')
+
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+_NULL_TIMER = nullcontext()
+
+
+def timer(name, **labels):
+    """Context manager observing the duration of its block in seconds"""
+    if not enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(counts), total) for key, (counts, total) in _histograms.items()}
+
+    lines = []
+    for name in sorted({name for name, _ in counters}):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        for (series, labels), value in sorted(counters.items()):
+            if series == name:
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+    for name in sorted({name for name, _ in histograms}):
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} histogram")
+        for (series, labels), (counts, total) in sorted(histograms.items()):
+            if series != name:
+                continue
+            cumulative = 0
+            for bound, count in zip(DEFAULT_BUCKETS, counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            cumulative += counts[-1]
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {cumulative}")
+    return '\n'.join(lines) + '\n'
+
+
+def write_textfile(path=None):
+    """Atomically rewrite the Prometheus textfile, so the collector never reads half a file"""
+    path = path or _textfile_path
+    if not path:
+        return
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(render())
+    os.replace(tmp_path, path)
+
+
+def _write_periodically(interval):
+    while not _stop.wait(interval):
+        write_textfile()
+
+
+def close():
+    """Write final counter and histogram totals to both outputs, then disable collection"""
+    global enabled, _jsonl, _stop, _writer_thread
+    if not enabled:
+        return
+    if _stop is not None:
+        _stop.set()
+        _writer_thread.join()
+        _stop = _writer_thread = None
+
+    write_textfile()
+    if _jsonl is not None:
+        now = time.time()
+        with _lock:
+            for (name, labels), value in sorted(_counters.items()):
+                _jsonl.write(json.dumps({'ts': now, 'metric': name, 'total': value, **dict(labels)}) + '\n')
+            for (name, labels), (counts, total) in sorted(_histograms.items()):
+                _jsonl.write(json.dumps({'ts': now, 'metric': name, 'count': sum(counts), 'sum': total,
+                                         **dict(labels)}) + '\n')
+        _jsonl.close()
+        _jsonl = None
+    enabled = False
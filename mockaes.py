@@ -0,0 +1,304 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+DEFAULT_PORT = 8600
+FIRST_EVENT_DATE = date(2024, 9, 7)
+AGES = range(11, 19)  # team ages 11-18, one age group per division
+
+EVENT_PATH = re.compile(r'^/api/event/([^/]+)$')
+STANDINGS_PATH = re.compile(r'^/odata/([^/]+)/standings\(dId=(\d+),')
+SCHEDULE_PATH = re.compile(r'^/api/event/([^/]+)/division/(\d+)/team/(\d+)/schedule/past$')
+
+
+class MockAES:
+    """
+    Deterministic synthetic AES data: `events` events of `divisions` divisions, each a round
+    robin of `teams` teams drawn from a shared pool, so teams meet again across events the
+    way real clubs do. Every payload has the shape samplescraper.py parses.
+    """
+
+    def __init__(self, events=50, divisions=8, teams=8, team_pool=None, seed=0):
+        self.events = events
+        self.divisions = divisions
+        self.teams = teams
+        # Enough teams per age that a division can always draw `teams` distinct ones
+        self.team_pool = max(team_pool or events * divisions * teams // 4, teams * len(AGES))
+        self.seed = seed
+
+    def event_key(self, event):
+        return f'MOCKEV{event:06d}'
+
+    def event_index(self, event_key):
+        if not event_key.startswith('MOCKEV'):
+            return None
+        event = int(event_key[6:])
+        return event if event < self.events else None
+
+    def event_date(self, event):
+        return FIRST_EVENT_DATE + timedelta(days=7 * (event // 10))
+
+    def division_id(self, event, division):
+        return event * 1000 + division + 1
+
+    def team_code(self, team_id):
+        age = AGES[team_id % len(AGES)]
+        return f'G{age}MOCK{team_id}'
+
+    def landing(self, skip, top):
+        keys = [self.event_key(e) for e in range(skip, min(skip + top, self.events))]
+        return {
+            '@odata.count': self.events,
+            'value': [{'eventSchedulerKey': key, 'name': f'Mock Event {key}'} for key in keys],
+        }
+
+    def event(self, event):
+        return {
+            'EventId': event + 1,
+            'Name': f'Mock Event {event}',
+            'Location': 'Mock Convention Center',
+            'StartDate': self.event_date(event).isoformat() + 'T00:00:00',
+            'Divisions': [
+                {
+                    'DivisionId': self.division_id(event, d),
+                    'Name': f'{AGES[d % len(AGES)]} Open {d // len(AGES) + 1}',
+                    'TeamCount': self.teams,
+                    'CodeAlias': f'{AGES[d % len(AGES)]}O',
+                }
+                for d in range(self.divisions)
+            ],
+        }
+
+    @lru_cache(maxsize=1024)
+    def division(self, event, division):
+        """Standings rows and each team's matches for one division, generated once and cached"""
+        rng = random.Random(f'{self.seed}:{event}:{division}')
+        age_slot = division % len(AGES)
+        candidates = range(age_slot, self.team_pool, len(AGES))
+        team_ids = rng.sample(candidates, self.teams)
+        division_id = self.division_id(event, division)
+        start = datetime.combine(self.event_date(event), datetime.min.time()) + timedelta(hours=8)
+
+        schedules = {team_id: [] for team_id in team_ids}
+        records = {team_id: [0, 0, 0, 0] for team_id in team_ids}  # matches won/lost, sets won/lost
+        for n, (first, second) in enumerate((a, b) for i, a in enumerate(team_ids) for b in team_ids[i + 1:]):
+            second_won = rng.random() < 0.5
+            winner, loser = (second, first) if second_won else (first, second)
+            # Best of three: 2-0, or 2-1 with the loser taking one of the first two sets
+            if rng.random() < 0.3:
+                set_winners = [loser, winner, winner] if rng.random() < 0.5 else [winner, loser, winner]
+            else:
+                set_winners = [winner, winner]
+            sets = []
+            for s, set_winner in enumerate(set_winners):
+                points = 15 if s == 2 else 25
+                losing_points = rng.randint(points - 12, points - 2)
+                first_takes = set_winner == first
+                sets.append({
+                    'FirstTeamScore': points if first_takes else losing_points,
+                    'SecondTeamScore': losing_points if first_takes else points,
+                })
+            match = {
+                'Play': {'CompleteShortName': f'Pool {division_id}'},
+                'Match': {
+                    'FirstTeamName': f'Mock Team {first}',
+                    'FirstTeamId': first,
+                    'SecondTeamName': f'Mock Team {second}',
+                    'SecondTeamId': second,
+                    'SecondTeamWon': second_won,
+                    'ScheduledStartDateTime': (start + timedelta(minutes=50 * n)).isoformat(),
+                    'Sets': sets,
+                },
+            }
+            schedules[first].append(match)
+            schedules[second].append(match)
+
+            records[winner][0] += 1
+            records[loser][1] += 1
+            for set_winner in set_winners:
+                records[set_winner][2] += 1
+                records[second if set_winner == first else first][3] += 1
+
+        ranked = sorted(team_ids, key=lambda t: (-records[t][0], records[t][1], t))
+        standings = {'value': [
+            {
+                'TeamId': team_id,
+                'TeamName': f'Mock Team {team_id}',
+                'TeamCode': self.team_code(team_id),
+                'Club': {'ClubId': team_id // 10, 'Name': f'Mock Club {team_id // 10}'},
+                'Division': {'DivisionId': division_id},
+                'MatchesWon': records[team_id][0],
+                'MatchesLost': records[team_id][1],
+                'SetsWon': records[team_id][2],
+                'SetsLost': records[team_id][3],
+                'FinishRank': rank,
+                'OverallRank': rank,
+            }
+            for rank, team_id in enumerate(ranked, 1)
+        ]}
+        return standings, schedules
+
+    def locate_division(self, event_key, division_id):
+        event = self.event_index(event_key)
+        if event is None or division_id // 1000 != event:
+            return None
+        division = division_id % 1000 - 1
+        if not 0 <= division < self.divisions:
+            return None
+        return event, division
+
+    def respond(self, path, query):
+        """Return the JSON payload for a request path, or None for a 404"""
+        if path == '/api/landing/events':
+            skip = int(query.get('$skip', ['0'])[0])
+            top = int(query.get('$top', ['100'])[0])
+            return self.landing(skip, top)
+
+        match = SCHEDULE_PATH.match(path)
+        if match:
+            located = self.locate_division(match.group(1), int(match.group(2)))
+            if located is None:
+                return None
+            return self.division(*located)[1].get(int(match.group(3)))
+
+        match = STANDINGS_PATH.match(path)
+        if match:
+            located = self.locate_division(match.group(1), int(match.group(2)))
+            return None if located is None else self.division(*located)[0]
+
+        match = EVENT_PATH.match(path)
+        if match:
+            event = self.event_index(match.group(1))
+            return None if event is None else self.event(event)
+
+        return None
+
+
+def endpoint_name(path):
+    if path.startswith('/api/landing/'):
+        return 'landing'
+    if STANDINGS_PATH.match(path):
+        return 'standings'
+    if path.endswith('/schedule/past'):
+        return 'schedule'
+    if path.startswith('/api/event/'):
+        return 'event'
+    return 'other'
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API behind its load balancer
+    disable_nagle_algorithm = True  # headers and body are separate writes; don't stall on delayed ACKs
+
+    def do_GET(self):
+        server = self.server
+        parts = urlsplit(self.path)
+        path = unquote(parts.path)
+
+        if path == '/__stats':
+            with server.stats_lock:
+                self.send_json(200, dict(server.stats))
+            return
+
+        if server.latency or server.jitter:
+            time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+
+        endpoint = endpoint_name(path)
+        if server.max_rps and not server.admit():
+            status, payload = 429, {'error': 'too many requests'}
+        elif random.random() < server.error_rate:
+            status, payload = server.error_status, {'error': 'injected failure'}
+        else:
+            payload = server.mock.respond(path, parse_qs(parts.query))
+            status = 200 if payload is not None else 404
+
+        size = self.send_json(status, payload)
+        with server.stats_lock:
+            stats = server.stats
+            stats['requests'] += 1
+            stats['bytes'] += size
+            stats['errors'] += status != 200
+            stats[f'{endpoint}_requests'] = stats.get(f'{endpoint}_requests', 0) + 1
+
+    def send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        if status in (429, 503):
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+        return len(body)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would swamp the benchmark output
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def admit(self):
+        """Count a request against max_rps in the current one-second window; False once it is full"""
+        with self.stats_lock:
+            window = int(time.monotonic())
+            if window != self.window:
+                self.window, self.window_requests = window, 0
+            self.window_requests += 1
+            return self.window_requests <= self.max_rps
+
+
+def make_server(mock, host='127.0.0.1', port=DEFAULT_PORT, latency=0.0, jitter=0.0,
+                error_rate=0.0, error_status=503, max_rps=0):
+    """
+    Build (not start) a threaded server for mock; latency and jitter are in seconds.
+    With max_rps, requests beyond that many per second are answered 429 with Retry-After.
+    """
+    server = MockServer((host, port), MockHandler)
+    server.mock = mock
+    server.latency = latency
+    server.jitter = jitter
+    server.error_rate = error_rate
+    server.error_status = error_status
+    server.max_rps = max_rps
+    server.window, server.window_requests = None, 0
+    server.stats = {'requests': 0, 'errors': 0, 'bytes': 0}
+    server.stats_lock = threading.Lock()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic AES landing/event/standings/schedule data locally")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--events', type=int, default=50, help="number of events")
+    parser.add_argument('--divisions', type=int, default=8, help="divisions per event")
+    parser.add_argument('--teams', type=int, default=8, help="teams per division (round robin)")
+    parser.add_argument('--team-pool', type=int, help="distinct teams shared across events")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--latency', type=float, default=0.0, help="milliseconds added to every response")
+    parser.add_argument('--jitter', type=float, default=0.0, help="random +/- milliseconds around --latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with an error")
+    parser.add_argument('--error-status', type=int, default=503, help="HTTP status of injected errors")
+    parser.add_argument('--max-rps', type=int, default=0,
+                        help="answer requests beyond this many per second with 429 (default: unlimited)")
+    args = parser.parse_args()
+
+    mock = MockAES(args.events, args.divisions, args.teams, args.team_pool, args.seed)
+    server = make_server(mock, args.host, args.port, args.latency / 1000, args.jitter / 1000,
+                         args.error_rate, args.error_status, args.max_rps)
+    print(f"Mock AES serving {args.events} events x {args.divisions} divisions x {args.teams} teams "
+          f"on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
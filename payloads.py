@@ -0,0 +1,219 @@
+import json
+from typing import List, Optional, Union
+
+# Fastest available decoder: msgspec decodes straight into the typed models below, skipping every
+# field they do not declare. Without it, orjson (or, failing that, the stdlib json module) builds
+# dicts and the same tuples are read out of them.
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+try:
+    import orjson
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+# Every decoder takes the raw response body and returns flat tuples of just the fields we store:
+#   decode_landing(content)   -> (@odata.count or None, [eventSchedulerKey, ...])
+#   decode_event(content)     -> (EventId, Name, Location, StartDate,
+#                                 [(DivisionId, Name, TeamCount, CodeAlias), ...])
+#   decode_standings(content) -> [(TeamId, TeamName, TeamCode, ClubId, ClubName, DivisionId, MatchesWon,
+#                                  MatchesLost, SetsWon, SetsLost, FinishRank, OverallRank), ...]
+#   decode_schedule(content)  -> [(CompleteShortName, FirstTeamId, SecondTeamId, SecondTeamWon,
+#                                  set 1 first/second team score, set 2 ..., set 3 ...,
+#                                  ScheduledStartDateTime), ...]
+# Matches keep their first three sets; missing sets are None.
+
+NO_SCORES = (None, None)
+
+
+def _landing_keys(data):
+    # Landing pages of an unexpected shape just list no events
+    if not isinstance(data, dict):
+        return None, []
+    count = data.get('@odata.count')
+    count = count if isinstance(count, int) else None
+    value = data.get('value')
+    if not isinstance(value, list):
+        return count, []
+    return count, [event['eventSchedulerKey'] for event in value if event.get('eventSchedulerKey')]
+
+
+def _event_fields(data):
+    divisions = [(d['DivisionId'], d['Name'], d['TeamCount'], d['CodeAlias']) for d in data['Divisions']]
+    return data['EventId'], data['Name'], data['Location'], data['StartDate'], divisions
+
+
+def _standings_rows(data):
+    rows = []
+    for team in data['value']:
+        club = team.get('Club')
+        rows.append((
+            team['TeamId'], team['TeamName'], team['TeamCode'],
+            club['ClubId'] if club is not None else None, club['Name'] if club is not None else None,
+            team['Division']['DivisionId'], team['MatchesWon'], team['MatchesLost'],
+            team['SetsWon'], team['SetsLost'], team['FinishRank'], team['OverallRank'],
+        ))
+    return rows
+
+
+def _schedule_rows(data):
+    rows = []
+    for entry in data:
+        match = entry['Match']
+        sets = match['Sets']
+        set1 = (sets[0]['FirstTeamScore'], sets[0]['SecondTeamScore']) if len(sets) > 0 else NO_SCORES
+        set2 = (sets[1]['FirstTeamScore'], sets[1]['SecondTeamScore']) if len(sets) > 1 else NO_SCORES
+        set3 = (sets[2]['FirstTeamScore'], sets[2]['SecondTeamScore']) if len(sets) > 2 else NO_SCORES
+        rows.append((
+            entry['Play']['CompleteShortName'], match['FirstTeamId'], match['SecondTeamId'],
+            match['SecondTeamWon'], *set1, *set2, *set3, match['ScheduledStartDateTime'],
+        ))
+    return rows
+
+
+if msgspec is not None:
+    # AES ids are numbers, but strings are accepted too (cached responses, older payloads)
+    Id = Union[int, str]
+
+    class _Payload(msgspec.Struct, rename='pascal', gc=False):
+        """
+        Base of the AES models: snake_case fields read from PascalCase keys (team_id <- TeamId).
+        gc=False: decoded payloads hold no reference cycles, so the collector can skip them.
+        """
+
+    class LandingEvent(msgspec.Struct, gc=False):
+        eventSchedulerKey: Optional[str] = None
+
+    class Landing(msgspec.Struct, gc=False):
+        count: Optional[int] = msgspec.field(default=None, name='@odata.count')
+        value: List[LandingEvent] = []
+
+    class Division(_Payload):
+        division_id: Id
+        name: Optional[str]
+        team_count: Optional[int]
+        code_alias: Optional[str]
+
+    class Event(_Payload):
+        event_id: Id
+        name: Optional[str]
+        location: Optional[str]
+        start_date: Optional[str]
+        divisions: List[Division]
+
+    class Club(_Payload):
+        club_id: Optional[Id]
+        name: Optional[str]
+
+    class StandingsDivision(_Payload):
+        division_id: Id
+
+    class StandingsTeam(_Payload):
+        team_id: Id
+        team_name: Optional[str]
+        team_code: Optional[str]
+        division: StandingsDivision
+        matches_won: Optional[int]
+        matches_lost: Optional[int]
+        sets_won: Optional[int]
+        sets_lost: Optional[int]
+        finish_rank: Optional[int]
+        overall_rank: Optional[int]
+        club: Optional[Club] = None
+
+    class Standings(msgspec.Struct, gc=False):
+        value: List[StandingsTeam]
+
+    class SetScore(_Payload):
+        first_team_score: Optional[int]
+        second_team_score: Optional[int]
+
+    class MatchDetail(_Payload):
+        first_team_id: Optional[Id]
+        second_team_id: Optional[Id]
+        second_team_won: Optional[bool]
+        scheduled_start_date_time: Optional[str]
+        sets: List[SetScore]
+
+    class Play(_Payload):
+        complete_short_name: Optional[str]
+
+    class ScheduleEntry(_Payload):
+        play: Play
+        match: MatchDetail
+
+    _landing_decoder = msgspec.json.Decoder(Landing)
+    _event_decoder = msgspec.json.Decoder(Event)
+    _standings_decoder = msgspec.json.Decoder(Standings)
+    _schedule_decoder = msgspec.json.Decoder(List[ScheduleEntry])
+
+    # A payload the models reject is decoded again as dicts, so installing msgspec never
+    # changes what gets stored: only the speed
+    def decode_landing(content):
+        try:
+            landing = _landing_decoder.decode(content)
+        except msgspec.ValidationError:
+            return _landing_keys(_loads(content))
+        return landing.count, [event.eventSchedulerKey for event in landing.value if event.eventSchedulerKey]
+
+    def decode_event(content):
+        try:
+            event = _event_decoder.decode(content)
+        except msgspec.ValidationError:
+            return _event_fields(_loads(content))
+        divisions = [(d.division_id, d.name, d.team_count, d.code_alias) for d in event.divisions]
+        return event.event_id, event.name, event.location, event.start_date, divisions
+
+    def decode_standings(content):
+        try:
+            standings = _standings_decoder.decode(content)
+        except msgspec.ValidationError:
+            return _standings_rows(_loads(content))
+        rows = []
+        for team in standings.value:
+            club = team.club
+            rows.append((
+                team.team_id, team.team_name, team.team_code,
+                club.club_id if club is not None else None, club.name if club is not None else None,
+                team.division.division_id, team.matches_won, team.matches_lost,
+                team.sets_won, team.sets_lost, team.finish_rank, team.overall_rank,
+            ))
+        return rows
+
+    def decode_schedule(content):
+        try:
+            entries = _schedule_decoder.decode(content)
+        except msgspec.ValidationError:
+            return _schedule_rows(_loads(content))
+        rows = []
+        for entry in entries:
+            match = entry.match
+            sets = match.sets
+            set1 = (sets[0].first_team_score, sets[0].second_team_score) if len(sets) > 0 else NO_SCORES
+            set2 = (sets[1].first_team_score, sets[1].second_team_score) if len(sets) > 1 else NO_SCORES
+            set3 = (sets[2].first_team_score, sets[2].second_team_score) if len(sets) > 2 else NO_SCORES
+            rows.append((
+                entry.play.complete_short_name, match.first_team_id, match.second_team_id,
+                match.second_team_won, *set1, *set2, *set3, match.scheduled_start_date_time,
+            ))
+        return rows
+
+    DECODER = 'msgspec'
+
+else:
+    def decode_landing(content):
+        return _landing_keys(_loads(content))
+
+    def decode_event(content):
+        return _event_fields(_loads(content))
+
+    def decode_standings(content):
+        return _standings_rows(_loads(content))
+
+    def decode_schedule(content):
+        return _schedule_rows(_loads(content))
+
+    DECODER = 'orjson' if _loads is not json.loads else 'json'
@@ -0,0 +1,50 @@
+import queue
+import threading
+
+DEFAULT_STAGE_QUEUE_SIZE = 1000  # URLs waiting in a stage before upstream producers block
+
+
+class Stage:
+    """
+    One step of the streaming crawl: a bounded queue of URLs drained by a pool of
+    worker threads that each call handler(url). Handlers feed later stages with put(),
+    so work flows downstream as soon as it is parsed, while the bounded queues
+    hold producers back when a later stage falls behind.
+    """
+
+    def __init__(self, name, handler, workers, maxsize=DEFAULT_STAGE_QUEUE_SIZE):
+        self.name = name
+        self.handler = handler
+        self.queue = queue.Queue(maxsize)
+        self.threads = [
+            threading.Thread(target=self._run, name=f'{name}-{i}', daemon=True)
+            for i in range(workers)
+        ]
+
+    def start(self):
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def put(self, url):
+        """Queue a URL for this stage; blocks while the stage is full"""
+        self.queue.put(url)
+
+    def close(self):
+        """Signal that no more URLs are coming; workers exit once the queue is drained"""
+        for _ in self.threads:
+            self.queue.put(None)
+
+    def join(self):
+        for thread in self.threads:
+            thread.join()
+
+    def _run(self):
+        while True:
+            url = self.queue.get()
+            if url is None:
+                return
+            try:
+                self.handler(url)
+            except Exception as e:
+                print(f"Unhandled error in {self.name} stage for {url}: {e}")
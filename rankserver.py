@@ -0,0 +1,380 @@
+import argparse
+import json
+import sqlite3
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import metrics
+import schema
+from readdb import connect_read_only
+
+DB_PATH = 'vbdatav4.db'
+DEFAULT_PORT = 8700
+DEFAULT_POLL_INTERVAL = 5.0  # seconds between checks of elo_state for a finished ELO run
+DEFAULT_LIMIT = 50           # leaderboard rows per page
+MAX_LIMIT = 1000
+RECENT_MATCHES = 10          # head-to-head matches listed, newest first
+
+
+class QueryError(Exception):
+    """A request the index cannot answer; sent back as a JSON error with this HTTP status"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def elo_version(cursor):
+    """
+    The elo_state row, which every ELO run rewrites in the same transaction as the ratings,
+    or None before the first run and while elo.py --full is rebuilding the tables. finished_at
+    is new on every run, so a replay that ends on the same watermark still counts as a new one.
+    """
+    try:
+        cursor.execute('''
+        SELECT last_match_time, last_match_id, max_match_id, match_count, finished_at
+        FROM elo_state WHERE id = 1
+        ''')
+    except sqlite3.OperationalError:
+        return None
+    # fetchall() finishes the statement; a half-read one would pin the connection to its snapshot
+    rows = cursor.fetchall()
+    return rows[0] if rows else None
+
+
+def encode(value):
+    return json.dumps(value, separators=(',', ':')).encode('utf-8')
+
+
+class RankingIndex:
+    """
+    Read-only snapshot of teams, team_elo and every team's match record, read in one transaction.
+    Leaderboards (overall, by age, by club and by both) are lists of pre-encoded JSON rows
+    sorted by rating, so a query is a dict lookup, a slice and a join. Matches are grouped
+    by team pair for head-to-head records. An index is never modified once built: a reload
+    builds a new one and swaps it in.
+    """
+
+    def __init__(self, conn):
+        started = time.perf_counter()
+        cursor = conn.cursor()
+        # One read transaction, so the ratings, the watermark and the matches agree
+        cursor.execute('BEGIN')
+        try:
+            self.version = elo_version(cursor)
+            records, self.pairs, self.match_count = self._load_matches(cursor)
+            cursor.execute('''
+            SELECT t.id, t.teamId, t.teamName, t.teamCode, t.clubId, t.clubName, t.teamAge, te.elo
+            FROM teams t
+            LEFT JOIN team_elo te ON te.team = t.id
+            ORDER BY te.elo DESC, t.teamName
+            ''')
+            rows = cursor.fetchall()
+        finally:
+            conn.commit()
+
+        self.teams = {}         # AES teamId -> team dict
+        self.ids = {}           # AES teamId -> teams.id
+        self.fragments = {}     # AES teamId -> the team dict, encoded
+        self.leaderboards = {}  # (teamAge or None, clubId or None) -> encoded rated teams, best first
+        age_ranks = {}
+        self.rated_count = 0
+        for id, team_id, name, code, club_id, club_name, age, elo in rows:
+            won, lost, sets_won, sets_lost = records.get(id, (0, 0, 0, 0))
+            team = {
+                'teamId': team_id,
+                'teamName': name,
+                'teamCode': code,
+                'clubId': club_id,
+                'clubName': club_name,
+                'teamAge': age,
+                'elo': None if elo is None else round(elo, 1),
+                'rank': None,
+                'ageRank': None,
+                'matchesWon': won,
+                'matchesLost': lost,
+                'setsWon': sets_won,
+                'setsLost': sets_lost,
+            }
+            if elo is not None:
+                # Rated teams come first, best first, so ranks are running counts
+                self.rated_count += 1
+                age_ranks[age] = age_ranks.get(age, 0) + 1
+                team['rank'] = self.rated_count
+                team['ageRank'] = age_ranks[age]
+            fragment = encode(team)
+            self.teams[team_id] = team
+            self.ids[team_id] = id
+            self.fragments[team_id] = fragment
+            if elo is not None:
+                # A set: without an age or club some of the keys coincide, and a team is listed once
+                for key in {(None, None), (age, None), (None, club_id), (age, club_id)}:
+                    self.leaderboards.setdefault(key, []).append(fragment)
+
+        self.loaded_at = time.time()
+        self.load_seconds = time.perf_counter() - started
+        metrics.observe('aes_rank_load_seconds', self.load_seconds)
+
+    @staticmethod
+    def _load_matches(cursor):
+        """
+        Returns ({teams.id: [matches won, lost, sets won, sets lost]},
+        {(lower id, higher id): [(match_time, bracket, team1, team2_won, set scores), ...] oldest first},
+        number of matches).
+        """
+        records = {}
+        pairs = {}
+        count = 0
+        cursor.execute('''
+        SELECT team1, team2, team2_won, match_time, bracket,
+               set1_team1_score, set1_team2_score, set2_team1_score, set2_team2_score,
+               set3_team1_score, set3_team2_score
+        FROM matches
+        ORDER BY match_time, matchId
+        ''')
+        for team1, team2, team2_won, match_time, bracket, *scores in cursor:
+            if team1 is None or team2 is None:
+                continue
+            count += 1
+            sets1 = sets2 = 0
+            for score1, score2 in zip(scores[0::2], scores[1::2]):
+                if score1 is not None and score2 is not None:
+                    sets1 += score1 > score2
+                    sets2 += score2 > score1
+            won1 = 0 if team2_won else 1
+            record1 = records.setdefault(team1, [0, 0, 0, 0])
+            record2 = records.setdefault(team2, [0, 0, 0, 0])
+            record1[0] += won1
+            record1[1] += 1 - won1
+            record1[2] += sets1
+            record1[3] += sets2
+            record2[0] += 1 - won1
+            record2[1] += won1
+            record2[2] += sets2
+            record2[3] += sets1
+            pairs.setdefault((min(team1, team2), max(team1, team2)), []).append(
+                (match_time, bracket, team1, bool(team2_won), scores))
+        return records, pairs, count
+
+    def leaderboard(self, age=None, club=None, offset=0, limit=DEFAULT_LIMIT):
+        """A page of rated teams, best first, optionally only one age group and/or club"""
+        rows = self.leaderboards.get((age, club), ())
+        return (b'{"total":%d,"offset":%d,"teams":[' % (len(rows), offset)
+                + b','.join(rows[offset:offset + limit]) + b']}')
+
+    def team(self, team_id):
+        fragment = self.fragments.get(team_id)
+        if fragment is None:
+            raise QueryError(404, f"unknown team {team_id}")
+        return fragment
+
+    def head_to_head(self, team_id1, team_id2):
+        """Both teams, their record against each other, team1's expected score, and their latest matches"""
+        for team_id in (team_id1, team_id2):
+            if team_id not in self.teams:
+                raise QueryError(404, f"unknown team {team_id}")
+        team1, team2 = self.teams[team_id1], self.teams[team_id2]
+        id1, id2 = self.ids[team_id1], self.ids[team_id2]
+        matches = self.pairs.get((min(id1, id2), max(id1, id2)), ())
+
+        wins1 = sets1 = sets2 = 0
+        recent = []
+        for match_time, bracket, first, team2_won, scores in reversed(matches):
+            # Turn each match around so the requested team1 comes first
+            swapped = first != id1
+            won1 = team2_won == swapped
+            sets = [[score1, score2] if not swapped else [score2, score1]
+                    for score1, score2 in zip(scores[0::2], scores[1::2])
+                    if score1 is not None and score2 is not None]
+            wins1 += won1
+            sets1 += sum(score1 > score2 for score1, score2 in sets)
+            sets2 += sum(score2 > score1 for score1, score2 in sets)
+            if len(recent) < RECENT_MATCHES:
+                recent.append({
+                    'matchTime': match_time,
+                    'bracket': bracket,
+                    'winner': team_id1 if won1 else team_id2,
+                    'sets': sets,
+                })
+
+        expected = None
+        if team1['elo'] is not None and team2['elo'] is not None:
+            # elo.expected_score
+            expected = round(1 / (1 + 10 ** ((team2['elo'] - team1['elo']) / 400)), 4)
+        return encode({
+            'team1': team1,
+            'team2': team2,
+            'team1ExpectedScore': expected,
+            'matches': len(matches),
+            'team1Wins': wins1,
+            'team2Wins': len(matches) - wins1,
+            'team1Sets': sets1,
+            'team2Sets': sets2,
+            'recent': recent,
+        })
+
+    def status(self):
+        return encode({
+            'loadedAt': self.loaded_at,
+            'loadSeconds': round(self.load_seconds, 3),
+            'teams': len(self.teams),
+            'ratedTeams': self.rated_count,
+            'matches': self.match_count,
+            'eloState': None if self.version is None else dict(zip(
+                ('lastMatchTime', 'lastMatchId', 'maxMatchId', 'matchCount', 'finishedAt'), self.version)),
+        })
+
+
+def int_param(query, name, default=None, minimum=None, maximum=None):
+    """Integer query parameter, or default when absent; out-of-range or non-numeric values are a 400"""
+    values = query.get(name)
+    if not values:
+        return default
+    try:
+        value = int(values[0])
+    except ValueError:
+        raise QueryError(400, f"{name} must be an integer") from None
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        raise QueryError(400, f"{name} must be between {minimum} and {maximum}")
+    return value
+
+
+def text_param(query, name, required=False):
+    values = query.get(name)
+    if not values or not values[0]:
+        if required:
+            raise QueryError(400, f"{name} is required")
+        return None
+    return values[0]
+
+
+def route(index, path, query):
+    """Answer one request from an index; returns (metrics endpoint label, encoded JSON body)"""
+    if path == '/leaderboard':
+        return 'leaderboard', index.leaderboard(
+            age=int_param(query, 'age'),
+            club=text_param(query, 'club'),
+            offset=int_param(query, 'offset', 0, minimum=0),
+            limit=int_param(query, 'limit', DEFAULT_LIMIT, minimum=1, maximum=MAX_LIMIT),
+        )
+    if path.startswith('/teams/'):
+        return 'team', index.team(path[len('/teams/'):])
+    if path == '/head-to-head':
+        return 'head_to_head', index.head_to_head(text_param(query, 'team1', required=True),
+                                                  text_param(query, 'team2', required=True))
+    if path == '/status':
+        return 'status', index.status()
+    raise QueryError(404, f"no such endpoint {path}")
+
+
+class RankingHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, so busy clients don't pay a connect per query
+    disable_nagle_algorithm = True  # headers and body are separate writes; don't stall on delayed ACKs
+
+    def do_GET(self):
+        started = time.perf_counter()
+        parts = urlsplit(self.path)
+        # Every request reads the index once, so a reload mid-request cannot mix two snapshots
+        index = self.server.index
+        try:
+            endpoint, body = route(index, unquote(parts.path).rstrip('/'), parse_qs(parts.query))
+            status = 200
+        except QueryError as e:
+            endpoint, status, body = 'error', e.status, encode({'error': str(e)})
+
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        metrics.observe('aes_rank_request_seconds', time.perf_counter() - started, endpoint=endpoint)
+
+    def log_message(self, format, *args):
+        pass  # one line per request would drown out the reload messages
+
+
+class RankingServer(ThreadingHTTPServer):
+    """
+    Serves queries from `index`, a RankingIndex, one thread per connection. A watcher thread
+    replaces `index` when an ELO run finishes; handlers never touch SQLite.
+    """
+    daemon_threads = True
+    request_queue_size = 512  # listen backlog, for hundreds of clients connecting at once
+
+    def __init__(self, address, db_path, poll_interval=DEFAULT_POLL_INTERVAL):
+        super().__init__(address, RankingHandler)
+        self.db_path = db_path
+        self.poll_interval = poll_interval
+        self.stopping = threading.Event()
+        conn = connect_read_only(db_path)
+        try:
+            self.index = RankingIndex(conn)
+        finally:
+            conn.close()
+        self.watcher = threading.Thread(target=self.watch, name='elo-watcher', daemon=True)
+
+    def watch(self):
+        """Poll elo_state on a connection of its own and load a new index once it changes"""
+        conn = connect_read_only(self.db_path)
+        try:
+            while not self.stopping.wait(self.poll_interval):
+                try:
+                    version = elo_version(conn.cursor())
+                    conn.commit()
+                    # None: elo.py --full has dropped the tables and not finished yet
+                    if version is None or version == self.index.version:
+                        continue
+                    index = RankingIndex(conn)
+                    if index.version is None:
+                        continue
+                    self.index = index
+                    metrics.inc('aes_rank_reloads_total')
+                    print(f"Reloaded {index.rated_count} ratings and {index.match_count} matches "
+                          f"in {index.load_seconds:.2f}s", flush=True)
+                except sqlite3.Error as e:
+                    print(f"Reload failed, still serving the previous ratings: {e}", flush=True)
+        finally:
+            conn.close()
+
+    def serve_forever(self, poll_interval=0.5):
+        self.watcher.start()
+        try:
+            super().serve_forever(poll_interval)
+        finally:
+            self.stopping.set()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve team ELO leaderboards, team lookups and head-to-head records as JSON")
+    parser.add_argument('--db', default=DB_PATH, help="database to serve")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--poll', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help=f"seconds between checks for a finished ELO run (default {DEFAULT_POLL_INTERVAL:g})")
+    parser.add_argument('--metrics-jsonl', metavar='PATH', help="append request and reload timings to PATH as JSON lines")
+    parser.add_argument('--metrics-textfile', metavar='PATH', help="write service metrics as a Prometheus textfile at PATH")
+    args = parser.parse_args()
+
+    conn = connect_read_only(args.db)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < schema.SCHEMA_VERSION:
+        parser.error(f"{args.db} has an older schema; open it with samplescraper.py or elo.py once to upgrade it")
+    if elo_version(cursor) is None:
+        parser.error(f"{args.db} has no ELO ratings yet (or only from an older elo.py); run elo.py first")
+    conn.close()
+
+    metrics.configure(args.metrics_jsonl, args.metrics_textfile)
+    server = RankingServer((args.host, args.port), args.db, args.poll)
+    index = server.index
+    print(f"Loaded {index.rated_count} ratings, {len(index.teams)} teams and {index.match_count} matches "
+          f"in {index.load_seconds:.2f}s; serving on http://{args.host}:{server.server_address[1]}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        metrics.close()
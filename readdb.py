@@ -1,35 +1,209 @@
+import argparse
+import gzip
+import itertools
+import json
 import sqlite3
 import csv
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 
-def export_table_to_csv(cursor, table_name, output_dir):
-    """Export a single table to a CSV file"""
-    # Get all rows from the table
-    cursor.execute(f"SELECT * FROM {table_name}")
-    rows = cursor.fetchall()
+import schema
+
+DB_PATH = 'vbdatav4.db'
+FETCH_SIZE = 10000  # rows pulled from SQLite per fetchmany call
+MANIFEST_FILE = 'manifest.json'  # base and delta files of every table, with their watermarks
+
+# Column whose maximum is recorded as a table's export watermark; every other table uses rowid.
+# The enrollments upsert gives a changed row a new rowid, so rowid catches changed rows as well
+# as new ones. Tables keyed on an INTEGER PRIMARY KEY keep their rowid and need a column here.
+WATERMARK_COLUMNS = {
+    'matches': 'updated_at',       # stamped on insert and when a result is corrected in place
+    'team_elo': 'updated_at',      # INSERT OR REPLACE keeps the team's rowid
+    'team_elo_history': 'seq',     # WITHOUT ROWID; seq keeps growing across incremental ELO runs
+    'frontier': 'updated_at',      # rows are updated in place
+    'events': 'updated_at',        # rows keep their id (rowid) when they change, see schema.py
+    'divisions': 'updated_at',
+    'teams': 'updated_at',
+}
+# Tables that some runs rebuild from scratch, with a query for what identifies the build. When it
+# differs from the manifest's, the table gets a new base instead of a delta.
+REBUILD_MARKERS = {
+    'team_elo': "SELECT replayed_at FROM elo_state WHERE id = 1",          # dropped at every full ELO replay
+    'team_elo_history': "SELECT replayed_at FROM elo_state WHERE id = 1",  # seq restarts at every full ELO replay
+}
+# Tiny tables updated in place with no usable watermark: exported whole every time
+SNAPSHOT_TABLES = {'elo_state', 'sqlite_sequence', 'dead_letters'}
+
+def open_csv(csv_filename, compress):
+    """Open a CSV file for writing, gzip-compressed when compress is set"""
+    if compress:
+        return gzip.open(csv_filename, 'wt', newline='', encoding='utf-8', compresslevel=6)
+    return open(csv_filename, 'w', newline='', encoding='utf-8')
+
+def csv_path(output_dir, name, timestamp, compress):
+    return os.path.join(output_dir, f"{name}_{timestamp}.csv{'.gz' if compress else ''}")
+
+def watermark_column(table_name):
+    """Column tracking what has been exported from a table, or None for tables always exported whole"""
+    if table_name in SNAPSHOT_TABLES:
+        return None
+    return WATERMARK_COLUMNS.get(table_name, 'rowid')
+
+def rebuild_marker(cursor, table_name):
+    """What identifies the current build of a table in REBUILD_MARKERS (None for every other table)"""
+    query = REBUILD_MARKERS.get(table_name)
+    if query is None:
+        return None
+    try:
+        cursor.execute(query)
+    except sqlite3.OperationalError:
+        return None
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+def stream_rows(cursor):
+    """Yield the rows of an executed query FETCH_SIZE at a time, so memory use does not grow with the table"""
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            return
+        yield rows
+
+def export_table_to_csv(cursor, table_name, output_dir, compress=False, timestamp=None,
+                        column=None, after=None, upto=None):
+    """
+    Export a single table to a CSV file.
+    With a watermark column, only rows with after < column <= upto are exported (either bound
+    may be None), and a delta file is written when after is set.
+    Returns (csv filename or None when there were no rows, row count).
+    """
+    conditions = []
+    params = []
+    if column is not None and after is not None:
+        conditions.append(f"{column} > ?")
+        params.append(after)
+    if column is not None and upto is not None:
+        conditions.append(f"{column} <= ?")
+        params.append(upto)
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
     
-    if not rows:
-        print(f"No data found in table {table_name}")
-        return
+    # Stream rows from the table
+    cursor.execute(f"SELECT * FROM {table_name}{where}", params)
+    batches = stream_rows(cursor)
+    first_batch = next(batches, None)
+    
+    if not first_batch:
+        if after is not None:
+            print(f"No new rows in table {table_name}")
+        else:
+            print(f"No data found in table {table_name}")
+        return None, 0
     
     # Get column names
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [column[1] for column in cursor.fetchall()]
+    columns = [column[0] for column in cursor.description]
     
     # Create CSV filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_filename = os.path.join(output_dir, f"{table_name}_{timestamp}.csv")
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    name = f"{table_name}_delta" if after is not None else table_name
+    csv_filename = csv_path(output_dir, name, timestamp, compress)
     
     # Write to CSV
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
+    row_count = 0
+    with open_csv(csv_filename, compress) as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(columns)  # Write header
-        writer.writerows(rows)    # Write data
+        writer.writerows(first_batch)
+        row_count += len(first_batch)
+        for rows in batches:
+            writer.writerows(rows)    # Write data
+            row_count += len(rows)
     
-    print(f"Exported {len(rows)} rows from {table_name} to {csv_filename}")
+    print(f"Exported {row_count} rows from {table_name} to {csv_filename}")
+    return csv_filename, row_count
 
-def export_team_elo_summary(cursor, output_dir):
+def connect_read_only(db_path):
+    """Open a read-only connection; each export worker gets its own"""
+    return sqlite3.connect(f'file:{db_path}?mode=ro', uri=True)
+
+def export_table_worker(db_path, table_name, output_dir, compress, timestamp, previous=None):
+    """
+    Process pool entry point: export one table over a private read-only connection.
+    previous is the table's manifest entry from the last export; when given, only rows past
+    its watermark are written, as a delta. A new base is written instead when there is no
+    usable previous entry, or when the table was rebuilt (its watermark went backwards,
+    or its REBUILD_MARKERS query gives something new).
+    Returns (table name, new manifest entry, rows exported).
+    """
+    conn = connect_read_only(db_path)
+    try:
+        cursor = conn.cursor()
+        column = watermark_column(table_name)
+        
+        # Fix the upper bound first, so rows committed while exporting wait for the next delta
+        watermark = None
+        if column is not None:
+            cursor.execute(f"SELECT MAX({column}) FROM {table_name}")
+            watermark = cursor.fetchone()[0]
+        rebuilt = rebuild_marker(cursor, table_name)
+        
+        delta = (previous is not None and column is not None
+                 and previous.get('column') == column
+                 and previous.get('watermark') is not None
+                 and watermark is not None and watermark >= previous['watermark']
+                 and previous.get('rebuilt') == rebuilt)
+        
+        if delta:
+            filename, row_count = export_table_to_csv(cursor, table_name, output_dir, compress, timestamp,
+                                                      column, previous['watermark'], watermark)
+            deltas = previous['deltas'] + ([os.path.basename(filename)] if filename else [])
+            entry = dict(previous, watermark=watermark, deltas=deltas, rebuilt=rebuilt)
+        else:
+            filename, row_count = export_table_to_csv(cursor, table_name, output_dir, compress, timestamp,
+                                                      column, None, watermark)
+            entry = {
+                'column': column,
+                'watermark': watermark,
+                'base': os.path.basename(filename) if filename else None,
+                'deltas': [],
+                'rebuilt': rebuilt,
+            }
+        return table_name, entry, row_count
+    finally:
+        conn.close()
+
+def export_team_elo_summary_worker(db_path, output_dir, compress, timestamp):
+    """Process pool entry point for the joined team ELO summary, which is always exported whole"""
+    conn = connect_read_only(db_path)
+    try:
+        filename, row_count = export_team_elo_summary(conn.cursor(), output_dir, compress, timestamp)
+        entry = {
+            'column': None,
+            'watermark': None,
+            'base': os.path.basename(filename) if filename else None,
+            'deltas': [],
+        }
+        return 'team_elo_summary', entry, row_count
+    finally:
+        conn.close()
+
+def load_manifest(output_dir):
+    """Read the export manifest, or an empty one before the first export"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    if not os.path.exists(path):
+        return {'tables': {}}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest atomically, so a crashed export leaves the previous one intact"""
+    path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+def export_team_elo_summary(cursor, output_dir, compress=False, timestamp=None):
     """Export joined data showing team ELO ratings with team names and division names"""
     
     # Query to join the four tables - one row per team with aggregated enrollment data
@@ -40,25 +214,26 @@ def export_team_elo_summary(cursor, output_dir):
         t.teamCode,
         t.teamAge,
         t.clubName,
-        COUNT(e.teamId) as total_enrollments,
+        COUNT(e.team) as total_enrollments,
         SUM(e.matchesWon) as total_matchesWon,
         SUM(e.matchesLost) as total_matchesLost,
         SUM(e.setsWon) as total_setsWon,
         SUM(e.setsLost) as total_setsLost,
         te.elo
     FROM teams t
-    LEFT JOIN enrollments e ON t.teamId = e.teamId
-    LEFT JOIN team_elo te ON t.teamId = te.teamId
-    GROUP BY t.teamId, t.teamName, t.teamCode, t.teamAge, t.clubName, te.elo
+    LEFT JOIN enrollments e ON e.team = t.id
+    LEFT JOIN team_elo te ON te.team = t.id
+    GROUP BY t.id
     ORDER BY te.elo DESC, t.teamName
     """
     
     cursor.execute(query)
-    rows = cursor.fetchall()
+    batches = stream_rows(cursor)
+    first_batch = next(batches, None)
     
-    if not rows:
+    if not first_batch:
         print("No data found for team ELO summary")
-        return
+        return None, 0
     
     # Define column headers
     columns = [
@@ -67,57 +242,89 @@ def export_team_elo_summary(cursor, output_dir):
     ]
     
     # Create CSV filename with timestamp
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    csv_filename = os.path.join(output_dir, f"team_elo_summary_{timestamp}.csv")
+    timestamp = timestamp or datetime.now().strftime("%Y%m%d_%H%M%S")
+    csv_filename = csv_path(output_dir, "team_elo_summary", timestamp, compress)
     
-    # Write to CSV
-    with open(csv_filename, 'w', newline='', encoding='utf-8') as csvfile:
+    # Write to CSV, collecting the ELO statistics on the way through
+    row_count = 0
+    teams_with_elo = 0
+    elo_max = elo_min = None
+    elo_sum = 0.0
+    with open_csv(csv_filename, compress) as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(columns)  # Write header
-        writer.writerows(rows)    # Write data
+        for rows in itertools.chain([first_batch], batches):
+            writer.writerows(rows)    # Write data
+            row_count += len(rows)
+            for row in rows:
+                elo = row[10]  # elo column (index 10)
+                if elo is not None:
+                    teams_with_elo += 1
+                    elo_sum += elo
+                    elo_max = elo if elo_max is None else max(elo_max, elo)
+                    elo_min = elo if elo_min is None else min(elo_min, elo)
     
-    print(f"Exported {len(rows)} rows from team ELO summary to {csv_filename}")
+    print(f"Exported {row_count} rows from team ELO summary to {csv_filename}")
     
     # Print some statistics
-    teams_with_elo = sum(1 for row in rows if row[10] is not None)  # elo column (index 10)
-    teams_without_elo = len(rows) - teams_with_elo
+    teams_without_elo = row_count - teams_with_elo
     
     print(f"Teams with ELO ratings: {teams_with_elo}")
     print(f"Teams without ELO ratings: {teams_without_elo}")
     
     if teams_with_elo > 0:
-        elo_values = [row[10] for row in rows if row[10] is not None]  # elo column (index 10)
-        print(f"Highest ELO: {max(elo_values):.1f}")
-        print(f"Lowest ELO: {min(elo_values):.1f}")
-        print(f"Average ELO: {sum(elo_values)/len(elo_values):.1f}")
+        print(f"Highest ELO: {elo_max:.1f}")
+        print(f"Lowest ELO: {elo_min:.1f}")
+        print(f"Average ELO: {elo_sum/teams_with_elo:.1f}")
+    return csv_filename, row_count
 
 def main():
+    parser = argparse.ArgumentParser(description="Export every table of the database to CSV")
+    parser.add_argument('--db', default=DB_PATH, help="database to export")
+    parser.add_argument('--output-dir', default="db_exports_v4", help="directory to write the CSV files to")
+    parser.add_argument('--gzip', action='store_true', help="write gzip-compressed .csv.gz files")
+    parser.add_argument('--delta', action='store_true',
+                        help="export only rows added or changed since the last export recorded in the manifest")
+    parser.add_argument('--jobs', type=int, default=os.cpu_count() or 1,
+                        help="tables exported in parallel, each on its own read-only connection")
+    args = parser.parse_args()
+    
     # Create output directory if it doesn't exist
-    output_dir = "db_exports_v4"
+    output_dir = args.output_dir
     os.makedirs(output_dir, exist_ok=True)
     
-    # Connect to the database
-    conn = sqlite3.connect('vbdatav4.db')
-    cursor = conn.cursor()
-    
     # Get list of all tables
+    conn = connect_read_only(args.db)
+    cursor = conn.cursor()
+    cursor.execute("PRAGMA user_version")
+    if cursor.fetchone()[0] < schema.SCHEMA_VERSION:
+        parser.error(f"{args.db} has an older schema; open it with samplescraper.py or elo.py once to upgrade it")
     cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")
     tables = [table[0] for table in cursor.fetchall()]
+    conn.close()
     
-    # Export each table
-    for table in tables:
-        export_table_to_csv(cursor, table, output_dir)
+    # One timestamp for the whole export, so its files sort together
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
     
-    # Export the joined team ELO summary
-    print("\n" + "="*50)
-    print("EXPORTING TEAM ELO SUMMARY")
-    print("="*50)
-    export_team_elo_summary(cursor, output_dir)
+    # Without --delta every table starts a new base; the manifest is rewritten either way
+    manifest = load_manifest(output_dir)
+    previous = manifest['tables'] if args.delta else {}
     
-    # Close the connection
-    conn.close()
+    # Export each table, plus the joined team ELO summary, across a pool of processes
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as pool:
+        futures = [pool.submit(export_table_worker, args.db, table, output_dir, args.gzip, timestamp,
+                               previous.get(table))
+                   for table in tables]
+        futures.append(pool.submit(export_team_elo_summary_worker, args.db, output_dir, args.gzip, timestamp))
+        results = [future.result() for future in futures]
+    
+    manifest = {'exported_at': timestamp, 'tables': {table: entry for table, entry, _ in results}}
+    save_manifest(output_dir, manifest)
     
-    print("\nExport complete! Files are in the 'db_exports_v4' directory.")
+    total_rows = sum(row_count for _, _, row_count in results)
+    kind = "delta" if args.delta else "full"
+    print(f"\nExport complete! {total_rows} rows ({kind}) from {len(tables)} tables are in the "
+          f"'{output_dir}' directory, listed in {MANIFEST_FILE}.")
 
 if __name__ == "__main__":
     main()
@@ -1,18 +1,52 @@
-import requests
+import argparse
 import csv
-import time
 import sqlite3
 import os
-import gc
-from datetime import datetime
+import sys
+import threading
+import time
+
+import frontier
+import metrics
+import payloads
+import schema
+import shards
+from dbwriter import DatabaseWriter
+from fetcher import Fetcher, DEFAULT_CONCURRENCY, DEFAULT_RATE, DEFAULT_MAX_RATE, DEFAULT_RETRIES
+from frontier import STAGE_EVENT, STAGE_DIVISION, STAGE_MATCH
+from httpcache import ResponseCache, DEFAULT_CACHE_DIR
+from matchplan import DivisionPlan, PlanLimiter
+from pipeline import Stage
+
+DB_PATH = 'vbdatav4.db'
+
+# Hosts of the AES landing and results APIs; --base-url points both elsewhere, e.g. at mockaes.py
+AES_BASE_URL = 'https://www.advancedeventsystems.com'
+RESULTS_BASE_URL = 'https://results.advancedeventsystems.com'
+
+# Not a frontier stage: re-checks standings of divisions that were already crawled
+STAGE_REFRESH = 'refresh'
+
+# (index, count) when this worker crawls one shard of the event keys, see shards.py
+shard = None
+
+# Set by --bulk-load: the writer batches bigger transactions and the secondary indexes wait until the end
+bulk_load = False
+
+# Per-thread read-only connections, see readCursor()
+readers = threading.local()
 
 # Database initialization
-def init_database():
-    conn = sqlite3.connect('vbdatav4.db')
+def init_database(bulk=False):
+    # Wait on locks rather than failing when several workers share the database
+    conn = sqlite3.connect(DB_PATH, timeout=60)
     cursor = conn.cursor()
     
     # Enable WAL mode for better concurrent access and performance
     cursor.execute('PRAGMA journal_mode=WAL')
+    if bulk:
+        # The WAL is checkpointed by the writer and finishBulkLoad(), not every 1000 pages
+        cursor.execute('PRAGMA wal_autocheckpoint=0')
     
     # Optimize database settings for bulk inserts
     cursor.execute('PRAGMA synchronous=NORMAL')
@@ -20,86 +54,147 @@ def init_database():
     cursor.execute('PRAGMA temp_store=MEMORY')
     cursor.execute('PRAGMA mmap_size=268435456')  # 256MB memory mapping
     
-    # Create indexes for better query performance
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS events (
-        eventId TEXT PRIMARY KEY,
-        eventName TEXT,
-        location TEXT,
-        startDate TEXT
-    )
-    ''')
+    # Core tables; databases from before the integer ids are migrated first, see schema.py
+    schema.upgrade(cursor)
     
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS divisions (
-        divisionId TEXT PRIMARY KEY,
-        eventId TEXT,
-        divisionName TEXT,
-        teamCount INTEGER,
-        codeAlias TEXT,
-        division_url TEXT,
-        FOREIGN KEY (eventId) REFERENCES events(eventId)
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS teams (
-        teamId TEXT PRIMARY KEY,
-        teamName TEXT,
-        teamCode TEXT,
-        clubId TEXT,
-        clubName TEXT,
-        teamAge INTEGER
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS enrollments (
-        teamId TEXT,
-        divisionId TEXT,     
-        matchesWon INTEGER,
-        matchesLost INTEGER,
-        setsWon INTEGER,
-        setsLost INTEGER,
-        finishRank INTEGER,
-        overallRank INTEGER,
-        matchUrl TEXT,
-        FOREIGN KEY (divisionId) REFERENCES divisions(divisionId),
-        FOREIGN KEY (teamId) REFERENCES teams(teamId)
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS matches (
-        matchId INTEGER PRIMARY KEY AUTOINCREMENT,
-        bracket TEXT,
-        team1_id TEXT,
-        team2_id TEXT,
-        team2_won BOOLEAN,
-        set1_team1_score INTEGER,
-        set1_team2_score INTEGER,
-        set2_team1_score INTEGER,
-        set2_team2_score INTEGER,
-        set3_team1_score INTEGER,
-        set3_team2_score INTEGER,
-        match_datetime DATETIME,
-        FOREIGN KEY (team1_id) REFERENCES teams(teamId),
-        FOREIGN KEY (team2_id) REFERENCES teams(teamId)
-    )
-    ''')
-    
-    # Create indexes for better performance
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_datetime ON matches(match_datetime)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_matches_teams ON matches(team1_id, team2_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_team ON enrollments(teamId)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_enrollments_division ON enrollments(divisionId)')
+    if bulk:
+        # Built again by finishBulkLoad(), or by the next run if this one is interrupted
+        for name in schema.SECONDARY_INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+    schema.create_indexes(cursor, secondary=not bulk)
+
+    # Crawl frontier: every URL the stages still have to fetch, so runs can resume
+    frontier.create_frontier_table(cursor)
     
     conn.commit()
     return conn
 
-# Initialize database before starting
-conn = init_database()
-cursor = conn.cursor()
+def finishBulkLoad(conn):
+    """Build the secondary indexes a bulk load deferred, then checkpoint and truncate the WAL"""
+    cursor = conn.cursor()
+    with metrics.timer('aes_index_seconds'):
+        started = time.perf_counter()
+        schema.create_indexes(cursor)
+        conn.commit()
+        print(f"Built indexes in {time.perf_counter() - started:.1f}s")
+    cursor.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+# Events, divisions and teams are looked up by their AES ids and keep their integer id once
+# stored. A team is written again for every division it plays in, and an enrollment on every
+# re-crawl. These upserts leave unchanged rows alone. A changed event, division or team gets a
+# new updated_at; a changed enrollment moves to a new rowid, as INSERT OR REPLACE used to. Either
+# way delta exports (readdb.py) pick it up. The ON CONFLICT clauses are shared with shardmerge.py.
+EVENT_ON_CONFLICT = '''
+ON CONFLICT (eventId) DO UPDATE SET
+    eventName = excluded.eventName,
+    location = excluded.location,
+    startDate = excluded.startDate,
+    updated_at = excluded.updated_at
+WHERE events.eventName IS NOT excluded.eventName
+   OR events.location IS NOT excluded.location
+   OR events.startDate IS NOT excluded.startDate
+'''
+
+EVENT_UPSERT = f'''
+INSERT INTO events (eventId, eventName, location, startDate, updated_at)
+VALUES (?, ?, ?, ?, ?)
+{EVENT_ON_CONFLICT}
+'''
+
+DIVISION_ON_CONFLICT = '''
+ON CONFLICT (divisionId) DO UPDATE SET
+    event = excluded.event,
+    divisionName = excluded.divisionName,
+    teamCount = excluded.teamCount,
+    codeAlias = excluded.codeAlias,
+    division_url = excluded.division_url,
+    updated_at = excluded.updated_at
+WHERE divisions.event IS NOT excluded.event
+   OR divisions.divisionName IS NOT excluded.divisionName
+   OR divisions.teamCount IS NOT excluded.teamCount
+   OR divisions.codeAlias IS NOT excluded.codeAlias
+   OR divisions.division_url IS NOT excluded.division_url
+'''
+
+DIVISION_UPSERT = f'''
+INSERT INTO divisions (divisionId, event, divisionName, teamCount, codeAlias, division_url, updated_at)
+VALUES (?, (SELECT id FROM events WHERE eventId = ?), ?, ?, ?, ?, ?)
+{DIVISION_ON_CONFLICT}
+'''
+
+TEAM_UPSERT = '''
+INSERT INTO teams (teamId, teamName, teamCode, clubId, clubName, teamAge, updated_at)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (teamId) DO UPDATE SET
+    teamName = excluded.teamName,
+    teamCode = excluded.teamCode,
+    clubId = excluded.clubId,
+    clubName = excluded.clubName,
+    teamAge = excluded.teamAge,
+    updated_at = excluded.updated_at
+WHERE teams.teamName IS NOT excluded.teamName
+   OR teams.teamCode IS NOT excluded.teamCode
+   OR teams.clubId IS NOT excluded.clubId
+   OR teams.clubName IS NOT excluded.clubName
+   OR teams.teamAge IS NOT excluded.teamAge
+'''
+
+# An opponent's id is needed before its own standings are stored (e.g. crossover matches):
+# it gets a row with just the AES id, filled in by TEAM_UPSERT later
+TEAM_PLACEHOLDER = 'INSERT OR IGNORE INTO teams (teamId, updated_at) VALUES (?, ?)'
+
+ENROLLMENT_ON_CONFLICT = '''
+ON CONFLICT (team, division) DO UPDATE SET
+    matchesWon = excluded.matchesWon,
+    matchesLost = excluded.matchesLost,
+    setsWon = excluded.setsWon,
+    setsLost = excluded.setsLost,
+    finishRank = excluded.finishRank,
+    overallRank = excluded.overallRank,
+    matchUrl = excluded.matchUrl,
+    rowid = (SELECT MAX(rowid) + 1 FROM enrollments)
+WHERE enrollments.matchesWon IS NOT excluded.matchesWon
+   OR enrollments.matchesLost IS NOT excluded.matchesLost
+   OR enrollments.setsWon IS NOT excluded.setsWon
+   OR enrollments.setsLost IS NOT excluded.setsLost
+   OR enrollments.finishRank IS NOT excluded.finishRank
+   OR enrollments.overallRank IS NOT excluded.overallRank
+   OR enrollments.matchUrl IS NOT excluded.matchUrl
+'''
+
+ENROLLMENT_UPSERT = f'''
+INSERT INTO enrollments (
+    team, division, matchesWon, matchesLost,
+    setsWon, setsLost, finishRank, overallRank, matchUrl
+) VALUES (
+    (SELECT id FROM teams WHERE teamId = ?), (SELECT id FROM divisions WHERE divisionId = ?),
+    ?, ?, ?, ?, ?, ?, ?
+)
+{ENROLLMENT_ON_CONFLICT}
+'''
+
+# The opponent's schedule may already have supplied a match, so the natural key turns the
+# copy into a no-op. Only a refreshed result with the same orientation and different scores
+# (e.g. a match first seen in progress) rewrites the row. Shared with shardmerge.py.
+MATCH_ON_CONFLICT = '''
+ON CONFLICT (bracket, match_time, min(team1, team2), max(team1, team2)) DO UPDATE SET
+    team2_won = excluded.team2_won,
+    set1_team1_score = excluded.set1_team1_score,
+    set1_team2_score = excluded.set1_team2_score,
+    set2_team1_score = excluded.set2_team1_score,
+    set2_team2_score = excluded.set2_team2_score,
+    set3_team1_score = excluded.set3_team1_score,
+    set3_team2_score = excluded.set3_team2_score,
+    updated_at = excluded.updated_at
+WHERE matches.team1 = excluded.team1
+  AND (matches.team2_won IS NOT excluded.team2_won
+       OR matches.set1_team1_score IS NOT excluded.set1_team1_score
+       OR matches.set1_team2_score IS NOT excluded.set1_team2_score
+       OR matches.set2_team1_score IS NOT excluded.set2_team1_score
+       OR matches.set2_team2_score IS NOT excluded.set2_team2_score
+       OR matches.set3_team1_score IS NOT excluded.set3_team1_score
+       OR matches.set3_team2_score IS NOT excluded.set3_team2_score)
+'''
 
 # example list of event urls:
 # event_url = ["https://results.advancedeventsystems.com/api/event/PTAwMDAwMzY3OTY90", "https://results.advancedeventsystems.com/api/event/PTAwMDAwMzY3OTY91", "https://results.advancedeventsystems.com/api/event/PTAwMDAwMzY3OTY92"]
@@ -107,34 +202,59 @@ cursor = conn.cursor()
 # single event url
 # event_url = ["https://results.advancedeventsystems.com/api/event/PTAwMDAwMzY3OTY90"]
 
-# getEventData() and getDivisionsForTourney() will populate these two lists automatically
-division_urls = []
-match_urls = []
-
-event_list = []
-
-def initEventUrls():
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=100&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=200&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=300&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=400&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=500&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=600&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=700&$top=100')
-    event_list.append('https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=((startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+5)&$format=json&$orderby=startDate+desc,name&$skip=800&$top=100')
-
-def getEventKeys():
+# Past events are listed from the landing pages, LANDING_PAGE_SIZE at a time. By default: the
+# 2024-25 season's events of type 5; --season-start, --season-end and --event-type pick others.
+LANDING_PAGE_SIZE = 100
+DEFAULT_SEASON_START = '2024-09-01'
+DEFAULT_SEASON_END = '2025-09-01'
+DEFAULT_EVENT_TYPES = [5]
+
+def landingUrl(season_start, season_end, event_types, skip=0):
+    """One landing page of past events of the given types that overlap [season_start, season_end)"""
+    types = '+or+'.join(f'eventType%2FeventTypeId+eq+{event_type}' for event_type in event_types)
+    return (f'{AES_BASE_URL}/api/landing/events?$count=true'
+            f'&$filter=((startDate+lt+{season_end}T05:00:00%2B00:00+and+endDate+ge+{season_start}T05:00:00%2B00:00)'
+            f'+and+isPastEvent+eq+true+and+({types}))'
+            f'&$format=json&$orderby=startDate+desc,name&$skip={skip}&$top={LANDING_PAGE_SIZE}')
+
+def discoverEventKeys(season_start, season_end, event_types):
+    """
+    Every event key listed on the landing pages, in listing order. The first page's $count
+    says how many pages there are; the rest are then fetched concurrently.
+    """
+    first_url = landingUrl(season_start, season_end, event_types)
+    print(f"Fetching event list from: {first_url}")
+    response = fetcher.get(first_url)
+    if response.status_code != 200:
+        print(f"Failed to fetch event list: HTTP {response.status_code}")
+        return []
+
+    count, keys = payloads.decode_landing(response.content)
+    if count is None:
+        count = len(keys)
+    pages = {0: keys}
+    page_skips = {landingUrl(season_start, season_end, event_types, skip): skip
+                  for skip in range(LANDING_PAGE_SIZE, count, LANDING_PAGE_SIZE)}
+    print(f"Landing pages list {count} events, fetching {len(page_skips)} more pages")
+
+    for url, response, error in fetcher.fetch_all(page_skips):
+        if error is not None:
+            print(f"Failed to fetch event list page {url}: {error}")
+        elif response.status_code != 200:
+            print(f"Failed to fetch event list page {url}: HTTP {response.status_code}")
+        else:
+            pages[page_skips[url]] = payloads.decode_landing(response.content)[1]
+
+    event_keys = list(dict.fromkeys(key for skip in sorted(pages) for key in pages[skip]))
+    if len(event_keys) < count:
+        print(f"Warning: only {len(event_keys)} of {count} listed events were read; rerun to pick up the rest")
+    return event_keys
+
+def getEventKeys(season_start, season_end, event_types):
 
     # url = 'https://www.advancedeventsystems.com/api/landing/events?$count=true&$filter=(isSchedulerPosted+eq+true+and+(startDate+lt+2025-09-01T05:00:00%2B00:00+and+endDate+ge+2024-09-01T05:00:00%2B00:00)+and+isPastEvent+eq+true+and+eventType%2FeventTypeId+eq+11)&$format=json&$orderby=startDate+desc,name&$top=100'
 
     
-    
-    headers = {
-        "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36", 
-        "Accept": "application/json, text/plain, */*",
-    }
-
     # Fetch all existing event keys from the database
     print("Fetching existing event keys from database...")
     cursor.execute("SELECT eventId FROM events")
@@ -144,38 +264,33 @@ def getEventKeys():
     event_urls = []
     
     try:
-        for url in event_list:
-            print(f"Fetching event data from: {url}")
-            response = requests.get(url, headers=headers)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Extract eventSchedulerKey values from the 'value' array
-                event_keys = []
-                if 'value' in data and isinstance(data['value'], list):
-                    for event in data['value']:
-                        if 'eventSchedulerKey' in event and event['eventSchedulerKey']:
-                            event_keys.append(event['eventSchedulerKey'])
-                
-                print(f"Total eventSchedulerKey values found: {len(event_keys)}")
-
-                skipped_count = 0
-                added_count = 0
-                
-                for event_key in event_keys:
-                    # Check if this event key already exists in the database
-                    if event_key in existing_event_ids:
-                        skipped_count += 1
-                    else:
-                        event_url = f'https://results.advancedeventsystems.com/api/event/{event_key}'
-                        event_urls.append(event_url)
-                        added_count += 1
-                
-                print(f"Skipped {skipped_count} existing events, added {added_count} new events")
-
+        # Extract eventSchedulerKey values from every landing page
+        event_keys = discoverEventKeys(season_start, season_end, event_types)
+        
+        print(f"Total eventSchedulerKey values found: {len(event_keys)}")
+
+        skipped_count = 0
+        added_count = 0
+        other_shard_count = 0
+        
+        for event_key in event_keys:
+            # In shard mode, other workers crawl the events that hash to their shards
+            if shard is not None and shards.shard_of(event_key, shard[1]) != shard[0]:
+                other_shard_count += 1
+            # Check if this event key already exists in the database
+            elif event_key in existing_event_ids:
+                skipped_count += 1
             else:
-                print(f"Failed to fetch data: HTTP {response.status_code}")
+                event_url = f'{RESULTS_BASE_URL}/api/event/{event_key}'
+                event_urls.append(event_url)
+                added_count += 1
+        
+        print(f"Skipped {skipped_count} existing events, added {added_count} new events")
+        metrics.inc('aes_event_keys_total', skipped_count, state='existing')
+        metrics.inc('aes_event_keys_total', added_count, state='new')
+        if shard is not None:
+            print(f"Left {other_shard_count} events to other shards")
+            metrics.inc('aes_event_keys_total', other_shard_count, state='other_shard')
                    
         return event_urls
     except Exception as e:
@@ -183,327 +298,526 @@ def getEventKeys():
         return event_urls
 
 
+# Typed decoder of each stage's payload, see payloads.py
+STAGE_DECODERS = {
+    STAGE_EVENT: payloads.decode_event,
+    STAGE_DIVISION: payloads.decode_standings,
+    STAGE_REFRESH: payloads.decode_standings,
+    STAGE_MATCH: payloads.decode_schedule,
+}
+
+
+def fetchStageUrl(url, stage, handler, fresh=False):
+    """Fetch one frontier url, pass its decoded payload to the stage handler and record failures"""
+    try:
+        response = fetcher.get(url, fresh=fresh)
+
+        if response.status_code == 200:
+            try:
+                with metrics.timer('aes_parse_seconds', stage=stage):
+                    handler(url, STAGE_DECODERS[stage](response.content))
+            except Exception:
+                # The cache keeps every 200; one that fails here must not be replayed on the next try
+                fetcher.discard(url)
+                raise
+        else:
+            print(f"Failed to fetch {stage} {url}: HTTP {response.status_code}")
+            failStageUrl(url, stage, f"HTTP {response.status_code}")
+
+    except Exception as e:
+        print(f"Error processing {stage} {url}: {e}")
+        failStageUrl(url, stage, e)
+
+
+def failStageUrl(url, stage, error):
+    """Give up on a url for this run (the fetcher has retried it already): dead-letter it for --retry-failed"""
+    # A refresh url is a division's standings page, done in the frontier; the next --refresh checks it again
+    if stage == STAGE_REFRESH:
+        return
+    writer.submit(lambda cursor: frontier.mark_failed(cursor, url, error))
+    metrics.inc('aes_dead_letters_total', stage=stage)
+
+
 # get a list of division urls from an event
-def getEventData(urls):
-    batch_size = 10  # Process in batches
-    processed = 0
-    
-    for url in urls:
-        try:
-            # url = "https://results.advancedeventsystems.com/api/event/PTAwMDAwMzY3OTY90"
-            parts = url.split('/')
-            eventKey = parts[len(parts)-1]
-
-            print(f'getting event data.. {eventKey}')
-
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36", 
-                "Accept": "application/json, text/plain, */*",
-            }
-
-            response = requests.get(url, headers=headers)
-
-            if response.status_code == 200:
-                data = response.json()  # for JSON responses
-
-                eventId = data["EventId"]
-                eventName = data["Name"]
-                location = data["Location"]
-                startDate = data["StartDate"]
-
-                # Insert event data
-                cursor.execute('''
-                INSERT OR REPLACE INTO events (eventId, eventName, location, startDate)
-                VALUES (?, ?, ?, ?)
-                ''', (eventId, eventName, location, startDate))
-
-                # Batch process divisions
-                division_batch = []
-                for division in data["Divisions"]:
-                    divisionId = division["DivisionId"]
-                    divisionName = division["Name"]
-                    teamCount = division["TeamCount"]
-                    codeAlias = division["CodeAlias"]
-                    division_url = f'https://results.advancedeventsystems.com/odata/{eventKey}/standings(dId={divisionId},cId=null,tIds=[])?$orderby=OverallRank,FinishRank,TeamName,TeamCode'
-
-                    division_batch.append((divisionId, eventId, divisionName, teamCount, codeAlias, division_url))
-                    division_urls.append(division_url)
-
-                # Batch insert divisions
-                cursor.executemany('''
-                INSERT OR REPLACE INTO divisions (divisionId, eventId, divisionName, teamCount, codeAlias, division_url)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ''', division_batch)
-
-                print(f"Added {len(division_batch)} divisions for event {eventKey}")
-
-                processed += 1
-                
-                # Commit every batch_size events to reduce I/O
-                if processed % batch_size == 0:
-                    conn.commit()
-                    print(f"Committed batch of {batch_size} events")
-                    gc.collect()  # Force garbage collection
-                
-                time.sleep(0.5)  # Reduced sleep time
+def getEventData(url, data):
+    # url = "https://results.advancedeventsystems.com/api/event/PTAwMDAwMzY3OTY90"
+    parts = url.split('/')
+    eventKey = parts[len(parts)-1]
 
-            else:
-                print(f"Failed to fetch {eventKey}: HTTP {response.status_code}")
+    eventId, eventName, location, startDate, divisions = data
 
-        except Exception as e:
-            print(f"Error processing event {url}: {e}")
-            continue
-    
-    # Final commit for remaining events
-    conn.commit()
-    print(f"Completed processing {processed} events")
-
-
-def getDivisionsForTourney(urls):
-    print("getting division data..")
-    batch_size = 50  # Process teams in batches
-    processed_urls = 0
-
-    for i, url in enumerate(urls):
-        try:
-            parts = url.split('/')
-            eventJibberish = parts[4]
-
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36", 
-                "Accept": "application/json, text/plain, */*",
-            }
-
-            response = requests.get(url, headers=headers)
-
-            if response.status_code == 200:
-                data = response.json()
-
-                # Batch process teams
-                team_batch = []
-                enrollment_batch = []
-                
-                for team in data["value"]:
-                    teamId = team["TeamId"]
-                    teamName = team["TeamName"]
-                    teamCode = team["TeamCode"]
-                    
-                    if "Club" in team and team["Club"] is not None:
-                        clubId = team["Club"]["ClubId"]
-                        clubName = team["Club"]["Name"]
-                    else:
-                        clubId = None
-                        clubName = None
-                    
-                    divisionId = team["Division"]["DivisionId"]
-                    matchesWon = team["MatchesWon"]
-                    matchesLost = team["MatchesLost"]
-                    setsWon = team["SetsWon"]
-                    setsLost = team["SetsLost"]
-                    finishRank = team["FinishRank"]
-                    overallRank = team["OverallRank"]
-                    matchUrl = f'https://results.advancedeventsystems.com/api/event/{eventJibberish}/division/{divisionId}/team/{teamId}/schedule/past'
-
-                    # Extract age from teamCode (2nd and 3rd characters)
-                    teamAge = None
-                    if teamCode and len(teamCode) >= 3:
-                        try:
-                            age_str = teamCode[1:3]  # Extract 2nd and 3rd characters
-                            teamAge = int(age_str)
-                        except ValueError:
-                            teamAge = None
-
-                    team_batch.append((teamId, teamName, teamCode, clubId, clubName, teamAge))
-                    enrollment_batch.append((teamId, divisionId, matchesWon, matchesLost, setsWon, setsLost, finishRank, overallRank, matchUrl))
-                    match_urls.append(matchUrl)
-
-                # Batch insert teams and enrollments
-                cursor.executemany('''
-                INSERT OR REPLACE INTO teams (
-                    teamId, teamName, teamCode, clubId, clubName, teamAge
-                ) VALUES (?, ?, ?, ?, ?, ?)
-                ''', team_batch)
-
-                cursor.executemany('''
-                INSERT OR REPLACE INTO enrollments (
-                    teamId, divisionId, matchesWon, matchesLost,
-                    setsWon, setsLost, finishRank, overallRank, matchUrl
-                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                ''', enrollment_batch)
-
-                print(f"Added {len(team_batch)} teams from division {i+1}/{len(urls)}")
-
-                processed_urls += 1
-                
-                # Commit every batch_size divisions
-                if processed_urls % batch_size == 0:
-                    conn.commit()
-                    print(f"Committed batch of {batch_size} divisions")
-                    gc.collect()  # Force garbage collection
-                
-                time.sleep(0.3)  # Reduced sleep time
+    # Batch process divisions
+    division_batch = []
+    for divisionId, divisionName, teamCount, codeAlias in divisions:
+        division_url = f'{RESULTS_BASE_URL}/odata/{eventKey}/standings(dId={divisionId},cId=null,tIds=[])?$orderby=OverallRank,FinishRank,TeamName,TeamCode'
+
+        division_batch.append((divisionId, eventId, divisionName, teamCount, codeAlias, division_url))
 
-            else:
-                print(f"Failed to fetch division {i+1}: HTTP {response.status_code}")
+    division_urls = [row[5] for row in division_batch]
+
+    def store(cursor):
+        # Upsert the event, then its divisions, which refer to it by id
+        now = time.time()
+        cursor.execute(EVENT_UPSERT, (eventId, eventName, location, startDate, now))
+        cursor.executemany(DIVISION_UPSERT, [row + (now,) for row in division_batch])
 
-        except Exception as e:
-            print(f"Error processing division {i+1}: {e}")
-            continue
-    
-    # Final commit
-    conn.commit()
-    print(f"Completed processing {processed_urls} divisions")
+        # The standings pages go straight to this worker's division stage
+        frontier.enqueue(cursor, STAGE_DIVISION, division_urls, claimed_by=worker_id)
+        frontier.mark_done(cursor, url)
 
+    writer.submit(store)
+    metrics.inc('aes_rows_total', stage=STAGE_EVENT, table='events')
+    metrics.inc('aes_rows_total', len(division_batch), stage=STAGE_EVENT, table='divisions')
+    print(f"Added {len(division_batch)} divisions for event {eventKey}")
 
-# get a list of matches from a team
-def getMatchData(urls):
-    print(f'getting match data for {len(urls)} matches..')
-    batch_size = 100  # Process matches in batches
-    processed_urls = 0
-    
-    for i, url in enumerate(urls):
-        try:
-            headers = {
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/135.0.0.0 Safari/537.36", 
-                "Accept": "application/json, text/plain, */*",
-            }
-
-            response = requests.get(url, headers=headers)
-
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Batch process matches
-                match_batch = []
-                
-                for match in data:
-                    bracket = match["Play"]["CompleteShortName"]
-                    first_team = match["Match"]["FirstTeamName"]
-                    first_team_id = match["Match"]["FirstTeamId"]
-                    second_team = match["Match"]["SecondTeamName"]
-                    second_team_id = match["Match"]["SecondTeamId"]
-                    second_team_won = match["Match"]["SecondTeamWon"]
-                    match_datetime = match["Match"]["ScheduledStartDateTime"]
-                    
-                    # Initialize set scores
-                    set1_team1 = set1_team2 = set2_team1 = set2_team2 = set3_team1 = set3_team2 = None
-                    
-                    # Extract set scores
-                    for j, set_score in enumerate(match["Match"]["Sets"], 1):
-                        if j == 1:
-                            set1_team1 = set_score["FirstTeamScore"]
-                            set1_team2 = set_score["SecondTeamScore"]
-                        elif j == 2:
-                            set2_team1 = set_score["FirstTeamScore"]
-                            set2_team2 = set_score["SecondTeamScore"]
-                        elif j == 3:
-                            set3_team1 = set_score["FirstTeamScore"]
-                            set3_team2 = set_score["SecondTeamScore"]
-
-                    # Parse datetime string to datetime object
-                    parsed_datetime = None
-                    if match_datetime:
-                        try:
-                            parsed_datetime = datetime.fromisoformat(match_datetime)
-                        except Exception:
-                            parsed_datetime = None
-                    
-                    match_batch.append((
-                        bracket, first_team_id, second_team_id, second_team_won,
-                        set1_team1, set1_team2, set2_team1, set2_team2,
-                        set3_team1, set3_team2, parsed_datetime
-                    ))
-
-                # Batch insert matches
-                if match_batch:
-                    cursor.executemany('''
-                    INSERT INTO matches (
-                        bracket, team1_id, team2_id, team2_won,
-                        set1_team1_score, set1_team2_score,
-                        set2_team1_score, set2_team2_score,
-                        set3_team1_score, set3_team2_score,
-                        match_datetime
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                    ''', match_batch)
-
-                print(f"Added {len(match_batch)} matches from team {i+1}/{len(urls)}")
-
-                processed_urls += 1
-                
-                # Commit every batch_size URLs
-                if processed_urls % batch_size == 0:
-                    conn.commit()
-                    print(f"Committed batch of {batch_size} team URLs")
-                    gc.collect()  # Force garbage collection
-                
-                time.sleep(0.2)  # Reduced sleep time
+    for division_url in division_urls:
+        division_stage.put(division_url)
 
-            else:
-                print(f"Failed to fetch matches for team {i+1}: HTTP {response.status_code}")
 
-        except Exception as e:
-            print(f"Error processing team {i+1}: {e}")
-            continue
-    
-    # Final commit
-    conn.commit()
-    print(f"Completed processing {processed_urls} team URLs")
+def parseStandings(url, data):
+    """Turn a division standings page into team rows and enrollment rows"""
+    parts = url.split('/')
+    eventJibberish = parts[4]
+
+    # Batch process teams
+    team_batch = []
+    enrollment_batch = []
+
+    for (teamId, teamName, teamCode, clubId, clubName, divisionId,
+         matchesWon, matchesLost, setsWon, setsLost, finishRank, overallRank) in data:
+        matchUrl = f'{RESULTS_BASE_URL}/api/event/{eventJibberish}/division/{divisionId}/team/{teamId}/schedule/past'
+
+        # Extract age from teamCode (2nd and 3rd characters)
+        teamAge = None
+        if teamCode and len(teamCode) >= 3:
+            try:
+                age_str = teamCode[1:3]  # Extract 2nd and 3rd characters
+                teamAge = int(age_str)
+            except ValueError:
+                teamAge = None
+
+        team_batch.append((teamId, teamName, teamCode, clubId, clubName, teamAge))
+        enrollment_batch.append((teamId, divisionId, matchesWon, matchesLost, setsWon, setsLost, finishRank, overallRank, matchUrl))
+
+    return team_batch, enrollment_batch
+
+
+def startDivisionPlan(enrollment_batch):
+    """Fetch a division's schedules in planned order, skipping teams whose opponents already supplied every match"""
+    # Standings not posted yet, or pools without a record: no way to tell the schedule is covered
+    plan = DivisionPlan((row[0], row[8], None if row[2] is None or row[3] is None else row[2] + row[3])
+                        for row in enrollment_batch)
+    plan_limiter.acquire()
+    for row in enrollment_batch:
+        match_plans[row[8]] = plan
+    advancePlan(plan)
+
+
+def unwrittenTeams(team_batch):
+    """Team rows that differ from what this run already wrote for the same team"""
+    return [row for row in team_batch if written_teams.get(row[0]) != row]
+
+
+def storeTeams(cursor, team_batch):
+    """
+    Upsert team rows (writer thread) and remember them once committed, so later appearances
+    are not written again. A unit that rolls back leaves them to be written by the next one.
+    """
+    now = time.time()
+    cursor.executemany(TEAM_UPSERT, [row + (now,) for row in team_batch])
+    writer.after_commit(lambda: written_teams.update((row[0], row) for row in team_batch))
+
+
+def storeTeamPlaceholders(cursor, team_ids):
+    """Make sure every teamId has a teams row (writer thread), so matches can refer to its id"""
+    missing = [team_id for team_id in team_ids if team_id not in written_teams]
+    if missing:
+        now = time.time()
+        cursor.executemany(TEAM_PLACEHOLDER, [(team_id, now) for team_id in missing])
+
+        def remember():
+            # None: the row exists, but this run has not written its values
+            for team_id in missing:
+                written_teams.setdefault(team_id, None)
+        writer.after_commit(remember)
+
+
+def getDivisionsForTourney(url, data):
+    team_batch, enrollment_batch = parseStandings(url, data)
+    team_batch = unwrittenTeams(team_batch)
+    match_urls = [row[8] for row in enrollment_batch]
+
+    def store(cursor):
+        # Batch upsert teams and enrollments
+        storeTeams(cursor, team_batch)
+        cursor.executemany(ENROLLMENT_UPSERT, enrollment_batch)
+
+        # The team schedules go straight to this worker's match stage
+        frontier.enqueue(cursor, STAGE_MATCH, match_urls, claimed_by=worker_id)
+        frontier.mark_done(cursor, url)
+
+    writer.submit(store)
+    metrics.inc('aes_rows_total', len(team_batch), stage=STAGE_DIVISION, table='teams')
+    metrics.inc('aes_rows_total', len(enrollment_batch), stage=STAGE_DIVISION, table='enrollments')
+    print(f"Added {len(team_batch)} teams from division {url}")
+
+    startDivisionPlan(enrollment_batch)
+
+
+def refreshDivision(url, data):
+    """
+    Refresh stage handler: compare a re-fetched standings page with the stored enrollments
+    and only re-fetch the schedules of teams whose match or set record changed.
+    """
+    team_batch, enrollment_batch = parseStandings(url, data)
+    if not enrollment_batch:
+        return
+
+    divisionId = enrollment_batch[0][1]
+    stored = {
+        row[0]: tuple(row[1:])
+        for row in readCursor().execute('''
+        SELECT t.teamId, e.matchesWon, e.matchesLost, e.setsWon, e.setsLost
+        FROM enrollments e
+        JOIN teams t ON t.id = e.team
+        WHERE e.division = (SELECT id FROM divisions WHERE divisionId = ?)
+        ''', (divisionId,))
+    }
 
+    # teamId is TEXT in the database; the payload may give it as a number
+    changed = [i for i, row in enumerate(enrollment_batch) if stored.get(str(row[0])) != tuple(row[2:6])]
+    refresh_stats['divisions'] += 1
+    if not changed:
+        return
 
+    changed_teams = unwrittenTeams([team_batch[i] for i in changed])
+    changed_enrollments = [enrollment_batch[i] for i in changed]
+    match_urls = [row[8] for row in changed_enrollments]
 
-def remove_duplicate_matches():
-    """Remove duplicate matches where team1_id and team2_id are swapped"""
-    print("Removing duplicate matches...")
+    def store(cursor):
+        storeTeams(cursor, changed_teams)
+        cursor.executemany(ENROLLMENT_UPSERT, changed_enrollments)
 
-    # Get total count before cleanup
-    cursor.execute("SELECT COUNT(*) FROM matches")
-    total_matches = cursor.fetchone()[0]
-    print(f"Total matches before cleanup: {total_matches}")
-    
-    # Use a more efficient query with EXISTS instead of JOIN
-    cursor.execute('''
-    DELETE FROM matches 
-    WHERE matchId IN (
-        SELECT m1.matchId
-        FROM matches m1
-        WHERE EXISTS (
-            SELECT 1 FROM matches m2 
-            WHERE (
-                (m1.team1_id = m2.team2_id AND m1.team2_id = m2.team1_id)
-                OR (m1.team1_id = m2.team1_id AND m1.team2_id = m2.team2_id)
+        # Completed schedules go back to this worker's match stage
+        frontier.requeue(cursor, STAGE_MATCH, match_urls, claimed_by=worker_id)
+
+    writer.submit(store)
+    metrics.inc('aes_rows_total', len(changed_teams), stage=STAGE_REFRESH, table='teams')
+    metrics.inc('aes_rows_total', len(changed_enrollments), stage=STAGE_REFRESH, table='enrollments')
+    refresh_stats['teams'] += len(changed)
+    print(f"{len(changed)} of {len(enrollment_batch)} teams changed in division {url}")
+
+    fresh_urls.update(match_urls)
+    startDivisionPlan(changed_enrollments)
+
+
+def advancePlan(plan, finished=False):
+    """Queue a division plan's next schedule fetch and record the teams it no longer needs to fetch"""
+    next_url, skipped, done = plan.advance(finished)
+
+    for skipped_url in skipped:
+        match_plans.pop(skipped_url, None)
+        writer.submit(lambda cursor, skipped_url=skipped_url: frontier.mark_skipped(cursor, skipped_url))
+    plan_stats['skipped'] += len(skipped)
+
+    if next_url is not None:
+        match_stage.put(next_url)
+    if done:
+        plan_limiter.release()
+
+
+def fetchTeamSchedule(url):
+    """Match stage handler: fetch a team schedule, then let its division plan pick the next one"""
+    plan = match_plans.get(url)
+    try:
+        fetchStageUrl(url, STAGE_MATCH, getMatchData, fresh=url in fresh_urls)
+    finally:
+        plan_stats['fetched'] += 1
+        if plan is not None:
+            match_plans.pop(url, None)
+            advancePlan(plan, finished=True)
+
+
+# get a list of matches from a team
+def getMatchData(url, data):
+    # Batch process matches
+    match_batch = []
+
+    for (bracket, first_team_id, second_team_id, second_team_won,
+         set1_team1, set1_team2, set2_team1, set2_team2, set3_team1, set3_team2, match_datetime) in data:
+        # Stored as epoch seconds (None when missing or unparseable)
+        match_time = schema.to_epoch(match_datetime)
+
+        match_batch.append((
+            bracket, first_team_id, second_team_id, second_team_won,
+            set1_team1, set1_team2, set2_team1, set2_team2,
+            set3_team1, set3_team2, match_time
+        ))
+
+    plan = match_plans.get(url)
+    if plan is not None:
+        plan.record(((row[0], row[10], min(row[1], row[2]), max(row[1], row[2])), row[1], row[2])
+                    for row in match_batch)
+
+    def store(cursor):
+        # Batch insert matches
+        if match_batch:
+            storeTeamPlaceholders(cursor, {team_id for row in match_batch for team_id in row[1:3]})
+            now = time.time()
+            # Copies already supplied by the opponent's schedule are no-ops, see MATCH_ON_CONFLICT
+            cursor.executemany(f'''
+            INSERT INTO matches (
+                bracket, team1, team2, team2_won,
+                set1_team1_score, set1_team2_score,
+                set2_team1_score, set2_team2_score,
+                set3_team1_score, set3_team2_score,
+                match_time, updated_at
+            ) VALUES (
+                ?, (SELECT id FROM teams WHERE teamId = ?), (SELECT id FROM teams WHERE teamId = ?),
+                ?, ?, ?, ?, ?, ?, ?, ?, ?
             )
-            AND m1.bracket = m2.bracket
-            AND m1.match_datetime = m2.match_datetime
-            AND m1.matchId > m2.matchId
-        )
-    )
-    ''')
-    
-    deleted_count = cursor.rowcount
-    conn.commit()
-    
-    print(f"Removed {deleted_count} duplicate matches")
-    
-    # Get total count after cleanup
-    cursor.execute("SELECT COUNT(*) FROM matches")
-    total_matches = cursor.fetchone()[0]
-    print(f"Total matches remaining: {total_matches}")
-    
-    # Optimize database after cleanup
-    cursor.execute("VACUUM")
-    print("Database optimized")
-
-
-# Close the database connection when done
-try:
-    initEventUrls()
-    event_urls = getEventKeys()
-    getEventData(event_urls)
-    getDivisionsForTourney(division_urls)
-    getMatchData(match_urls)
-    
-    # Remove duplicate matches
-    remove_duplicate_matches()
-finally:
-    conn.close()
+            {MATCH_ON_CONFLICT}
+            ''', [row + (now,) for row in match_batch])
+
+        frontier.mark_done(cursor, url)
+
+    writer.submit(store)
+    metrics.inc('aes_rows_total', len(match_batch), stage=STAGE_MATCH, table='matches')
+    print(f"Added {len(match_batch)} matches from team {url}")
+
+
+def readCursor():
+    """Read-only connection for the calling worker thread, for handlers that compare with stored rows"""
+    reader = getattr(readers, 'conn', None)
+    if reader is None:
+        reader = readers.conn = sqlite3.connect(f'file:{DB_PATH}?mode=ro', uri=True, timeout=60)
+    return reader.cursor()
+
+
+def getRefreshUrls(since=None):
+    """Standings urls of every stored division, optionally only for events starting on or after `since`"""
+    if since is None:
+        cursor.execute("SELECT division_url FROM divisions")
+    else:
+        cursor.execute('''
+        SELECT d.division_url FROM divisions d
+        JOIN events e ON e.id = d.event
+        WHERE e.startDate >= ?
+        ''', (since,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def feedLeftovers(stage_name, stage):
+    """Claim urls left pending by earlier runs (or other workers) and queue them on a stage"""
+    fed = 0
+    while True:
+        urls = frontier.claim(conn, stage_name, worker_id, 100, started_at=started_at)
+        if not urls:
+            break
+        for url in urls:
+            stage.put(url)
+        fed += len(urls)
+
+    if fed:
+        print(f"Queued {fed} {stage_name} URLs from the frontier")
+
+
+def runPipeline(event_urls, workers, refresh_urls=()):
+    """
+    Stream the crawl: each parsed event feeds its divisions downstream and each standings
+    page feeds its team schedules, while the writer thread batches everything into the db.
+    refresh_urls are standings pages of stored divisions to re-check for changed records.
+    """
+    global writer, division_stage, match_stage, match_plans, plan_limiter, plan_stats
+    global fresh_urls, refresh_stats, written_teams
+
+    writer = DatabaseWriter(DB_PATH, bulk=bulk_load)
+    writer.start()
+
+    # Division plans hand schedules to the match stage one at a time; the limiter on active
+    # plans bounds the match queue instead, so match workers never block re-queueing
+    match_plans = {}
+    plan_limiter = PlanLimiter()
+    plan_stats = {'fetched': 0, 'skipped': 0}
+
+    # Schedules of refreshed teams must bypass the response cache
+    fresh_urls = set()
+
+    # Team rows committed so far, by teamId; only the writer thread adds to it, after each commit
+    written_teams = {}
+    refresh_stats = {'divisions': 0, 'teams': 0}
+
+    event_stage = Stage(STAGE_EVENT, lambda url: fetchStageUrl(url, STAGE_EVENT, getEventData), workers).start()
+    division_stage = Stage(STAGE_DIVISION, lambda url: fetchStageUrl(url, STAGE_DIVISION, getDivisionsForTourney), workers).start()
+    refresh_stage = Stage(STAGE_REFRESH, lambda url: fetchStageUrl(url, STAGE_REFRESH, refreshDivision, fresh=True), workers).start()
+    match_stage = Stage(STAGE_MATCH, fetchTeamSchedule, workers, maxsize=0).start()
+
+    started = time.perf_counter()
+    try:
+        # New events join whatever earlier runs left pending, and are claimed from the frontier with it
+        writer.submit(lambda cursor: frontier.enqueue(cursor, STAGE_EVENT, event_urls))
+        writer.flush()
+
+        # A stage only closes once everything upstream has finished feeding it
+        for stage_name, stage in ((STAGE_EVENT, event_stage), (STAGE_DIVISION, division_stage),
+                                  (STAGE_REFRESH, refresh_stage), (STAGE_MATCH, match_stage)):
+            if stage is refresh_stage:
+                for url in refresh_urls:
+                    stage.put(url)
+            else:
+                feedLeftovers(stage_name, stage)
+            if stage is match_stage:
+                plan_limiter.wait_idle()
+            stage.close()
+            stage.join()
+            metrics.observe('aes_stage_seconds', time.perf_counter() - started, stage=stage_name)
+            print(f"Completed {stage_name} stage")
+    finally:
+        writer.close()
+
+    print(f"Pipeline wrote {writer.rows_written} rows in {writer.commits} commits, "
+          f"{writer.busy_seconds:.1f}s of writer time")
+    print(f"Fetched {plan_stats['fetched']} team schedules, skipped {plan_stats['skipped']} already covered by opponents")
+    if refresh_urls:
+        print(f"Refreshed {refresh_stats['divisions']} divisions, {refresh_stats['teams']} teams had new results")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Scrape AES tournament results into vbdatav4.db")
+    parser.add_argument('--concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                        help=f"maximum requests in flight at once (default {DEFAULT_CONCURRENCY})")
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE,
+                        help=f"starting requests per second per host, adjusted to what the server tolerates (default {DEFAULT_RATE})")
+    parser.add_argument('--max-rate', type=float, default=DEFAULT_MAX_RATE,
+                        help=f"never raise a host's rate above this many requests per second (default {DEFAULT_MAX_RATE})")
+    parser.add_argument('--fixed-rate', action='store_true',
+                        help="keep every host at --rate instead of adapting to latency and 429/5xx responses")
+    parser.add_argument('--retries', type=int, default=DEFAULT_RETRIES,
+                        help=f"retry a request that got no response or a 429/5xx this many times, with exponential "
+                             f"backoff, before dead-lettering its URL (default {DEFAULT_RETRIES})")
+    parser.add_argument('--retry-failed', action='store_true',
+                        help="instead of listing new events, fetch only the dead-lettered URLs of earlier runs "
+                             "(and whatever they lead to)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help=f"directory for the on-disk response cache (default {DEFAULT_CACHE_DIR})")
+    parser.add_argument('--no-cache', action='store_true',
+                        help="always fetch from the network and do not store responses")
+    parser.add_argument('--replay', action='store_true',
+                        help="run purely from the response cache, with no network traffic")
+    parser.add_argument('--worker-id', default=frontier.default_worker_id(),
+                        help="name this worker when several processes drain the same frontier")
+    parser.add_argument('--release-claims', action='store_true',
+                        help="requeue URLs left in progress by a crashed run (only when no other worker is running)")
+    parser.add_argument('--refresh', action='store_true',
+                        help="also re-fetch the standings of stored divisions and re-crawl teams whose record changed")
+    parser.add_argument('--since', metavar='DATE',
+                        help="with --refresh, only refresh events starting on or after DATE (YYYY-MM-DD)")
+    parser.add_argument('--bulk-load', action='store_true',
+                        help="for large first loads: build the secondary indexes once at the end and write in bigger, unsynced batches")
+    parser.add_argument('--season-start', metavar='DATE', default=DEFAULT_SEASON_START,
+                        help=f"crawl past events ending on or after DATE (default {DEFAULT_SEASON_START})")
+    parser.add_argument('--season-end', metavar='DATE', default=DEFAULT_SEASON_END,
+                        help=f"crawl past events starting before DATE (default {DEFAULT_SEASON_END})")
+    parser.add_argument('--event-type', type=int, action='append', metavar='ID',
+                        help=f"AES event type id to crawl; repeat for several (default {DEFAULT_EVENT_TYPES[0]})")
+    parser.add_argument('--base-url', metavar='URL',
+                        help="serve every AES endpoint from URL (scheme://host:port) instead, e.g. a local mockaes.py")
+    parser.add_argument('--db', default=DB_PATH,
+                        help=f"database to crawl into (default {DB_PATH})")
+    parser.add_argument('--shard', type=shards.parse_shard, metavar='INDEX/COUNT',
+                        help="crawl only the events hashed to shard INDEX of COUNT, into its own shard database "
+                             "beside --db; combine the shards with shardmerge.py")
+    parser.add_argument('--metrics-jsonl', metavar='PATH',
+                        help="append request/parse/commit timings and counters to PATH as JSON lines")
+    parser.add_argument('--metrics-textfile', metavar='PATH',
+                        help="keep a Prometheus textfile of the same metrics at PATH (e.g. for node_exporter)")
+    args = parser.parse_args()
+
+    if args.replay and args.no_cache:
+        parser.error("--replay needs the response cache; drop --no-cache")
+    if args.replay and args.refresh:
+        parser.error("--refresh needs live standings; it cannot run with --replay")
+    if args.bulk_load and args.refresh:
+        parser.error("--refresh looks up stored enrollments by index; it cannot run with --bulk-load")
+    if args.retry_failed and args.refresh:
+        parser.error("--retry-failed only drains the dead letters; run --refresh separately")
+
+    if args.base_url:
+        AES_BASE_URL = RESULTS_BASE_URL = args.base_url.rstrip('/')
+
+    DB_PATH = args.db
+    if args.shard is not None:
+        shard = args.shard
+        DB_PATH = shards.shard_db_path(args.db, *shard)
+        print(f"Crawling shard {shard[0]} of {shard[1]} into {DB_PATH}")
+
+    metrics.configure(args.metrics_jsonl, args.metrics_textfile)
+
+    cache = None if args.no_cache else ResponseCache(args.cache_dir)
+
+    # Fetches overlap on worker threads; all crawl writes go through a single writer thread
+    fetcher = Fetcher(concurrency=args.concurrency, rate=args.rate, cache=cache, replay=args.replay,
+                      adaptive=not args.fixed_rate, max_rate=args.max_rate, retries=args.retries)
+    worker_id = args.worker_id
+    # Claims this process makes from here on never expire under it, see frontier.claim
+    started_at = time.time()
+
+    # Initialize database before starting
+    bulk_load = args.bulk_load
+    conn = init_database(bulk=bulk_load)
+    cursor = conn.cursor()
+
+    # Close the database connection when done
+    try:
+        if args.release_claims:
+            released = frontier.release_claims(conn)
+            print(f"Released {released} in-progress frontier URLs")
+        else:
+            # Claims of crashed workers on this host are free at once; other hosts' wait for the lease
+            released = frontier.release_dead_claims(conn)
+            if released:
+                print(f"Released {released} frontier URLs claimed by workers that are no longer running")
+
+        if args.retry_failed:
+            # The dead letters go back to pending and are claimed like any leftover frontier work.
+            # They are fetched afresh: a bad body cached by an older run would only fail again.
+            for url in frontier.dead_letter_urls(cursor):
+                fetcher.discard(url)
+            requeued = frontier.requeue_dead_letters(conn)
+            print(f"Retrying {sum(requeued.values())} dead-lettered URLs: "
+                  + (', '.join(f"{count} {stage}" for stage, count in requeued.items()) or "none"))
+            event_urls = []
+        else:
+            with metrics.timer('aes_stage_seconds', stage='event_keys'):
+                event_urls = getEventKeys(args.season_start, args.season_end, args.event_type or DEFAULT_EVENT_TYPES)
+
+        # Stages overlap; completed frontier work is skipped, so a restarted run picks up where it stopped
+        refresh_urls = getRefreshUrls(args.since) if args.refresh else []
+        runPipeline(event_urls, args.concurrency, refresh_urls)
+        if bulk_load:
+            finishBulkLoad(conn)
+
+        recovered = frontier.clear_recovered(conn)
+        dead = frontier.dead_letter_count(cursor)
+        if recovered or dead:
+            print(f"Recovered {recovered} dead-lettered URLs; {dead} remain"
+                  + (" in the dead_letters table, rerun with --retry-failed" if dead else ""))
+
+        for host, rate in fetcher.rates().items():
+            print(f"Finished at {rate:.1f} requests/sec for {host}")
+
+        # Work still claimed by another worker (live, or dead on another host) is not finished
+        unfinished = {stage: frontier.remaining(cursor, stage) for stage in (STAGE_EVENT, STAGE_DIVISION, STAGE_MATCH)}
+        if any(unfinished.values()):
+            print(f"{sum(unfinished.values())} frontier URLs are still in progress elsewhere: "
+                  + ', '.join(f"{count} {stage}" for stage, count in unfinished.items() if count)
+                  + "; rerun once their worker has finished or its lease has expired")
+    finally:
+        conn.close()
+        metrics.close()
+
+    if any(unfinished.values()):
+        sys.exit(1)
+
 
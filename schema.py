@@ -0,0 +1,311 @@
+import calendar
+import time
+from datetime import datetime
+
+import metrics
+
+# PRAGMA user_version of a database with the current core tables. Version 2 keys events,
+# divisions and teams on integer surrogate ids (the AES ids stay as unique lookup columns)
+# and stores match times as epoch seconds. Version 3 adds matches.updated_at.
+SCHEMA_VERSION = 3
+
+# Indexes every insert has to maintain but no crawl stage reads; a bulk load builds them once, at the end
+SECONDARY_INDEXES = {
+    'idx_matches_time': 'matches(match_time)',
+    'idx_matches_teams': 'matches(team1, team2)',
+    'idx_enrollments_division': 'enrollments(division)',
+}
+
+
+def to_epoch(value):
+    """Epoch seconds of an ISO 8601 start time (times without an offset are taken as UTC), or None"""
+    if not value:
+        return None
+    try:
+        return calendar.timegm(datetime.fromisoformat(str(value)).utctimetuple())
+    except ValueError:
+        return None
+
+
+def create_tables(cursor):
+    """Create the core tables, if missing"""
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS events (
+        id INTEGER PRIMARY KEY,
+        eventId TEXT NOT NULL UNIQUE,
+        eventName TEXT,
+        location TEXT,
+        startDate TEXT,
+        updated_at REAL
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS divisions (
+        id INTEGER PRIMARY KEY,
+        divisionId TEXT NOT NULL UNIQUE,
+        event INTEGER,
+        divisionName TEXT,
+        teamCount INTEGER,
+        codeAlias TEXT,
+        division_url TEXT,
+        updated_at REAL,
+        FOREIGN KEY (event) REFERENCES events(id)
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS teams (
+        id INTEGER PRIMARY KEY,
+        teamId TEXT NOT NULL UNIQUE,
+        teamName TEXT,
+        teamCode TEXT,
+        clubId TEXT,
+        clubName TEXT,
+        teamAge INTEGER,
+        updated_at REAL
+    )
+    ''')
+
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS enrollments (
+        team INTEGER,
+        division INTEGER,
+        matchesWon INTEGER,
+        matchesLost INTEGER,
+        setsWon INTEGER,
+        setsLost INTEGER,
+        finishRank INTEGER,
+        overallRank INTEGER,
+        matchUrl TEXT,
+        FOREIGN KEY (division) REFERENCES divisions(id),
+        FOREIGN KEY (team) REFERENCES teams(id)
+    )
+    ''')
+
+    # match_time: epoch seconds of the scheduled start, NULL when AES gave none.
+    # updated_at: when the row was inserted or its result last corrected in place, so ELO
+    # runs and delta exports notice corrections
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS matches (
+        matchId INTEGER PRIMARY KEY AUTOINCREMENT,
+        bracket TEXT,
+        team1 INTEGER,
+        team2 INTEGER,
+        team2_won BOOLEAN,
+        set1_team1_score INTEGER,
+        set1_team2_score INTEGER,
+        set2_team1_score INTEGER,
+        set2_team2_score INTEGER,
+        set3_team1_score INTEGER,
+        set3_team2_score INTEGER,
+        match_time INTEGER,
+        updated_at REAL,
+        FOREIGN KEY (team1) REFERENCES teams(id),
+        FOREIGN KEY (team2) REFERENCES teams(id)
+    )
+    ''')
+
+
+def has_column(cursor, table, column):
+    cursor.execute("SELECT 1 FROM pragma_table_info(?) WHERE name = ?", (table, column))
+    return cursor.fetchone() is not None
+
+
+def upgrade(cursor):
+    """
+    Bring the core tables up to SCHEMA_VERSION, creating them if missing.
+    Returns True when an older database was migrated.
+    """
+    cursor.execute('PRAGMA user_version')
+    version = cursor.fetchone()[0]
+    migrated = False
+    if version < 2 and has_column(cursor, 'matches', 'team1_id'):
+        migrate_to_surrogate_keys(cursor)
+        migrated = True
+    create_tables(cursor)
+    if version < 3:
+        if not has_column(cursor, 'matches', 'updated_at'):
+            cursor.execute('ALTER TABLE matches ADD COLUMN updated_at REAL')
+        # Stamp the existing rows, so delta exports have a watermark to start from
+        cursor.execute('UPDATE matches SET updated_at = ? WHERE updated_at IS NULL', (time.time(),))
+    if version < SCHEMA_VERSION:
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+    return migrated
+
+
+def migrate_to_surrogate_keys(cursor):
+    """
+    Rebuild version 1 tables (keyed on AES id text, match_datetime as datetime text) with
+    integer surrogate keys and epoch match times, in one transaction. matchIds are kept, so
+    delta exports and the ELO watermark still line up; the ELO tables are derived from the
+    old keys and are dropped, for the next elo.py run to replay in full. The natural keys and
+    secondary indexes are created again afterwards by the caller, with create_indexes().
+    """
+    print("Migrating the database to integer team/division/event ids and epoch match times...")
+    started = time.perf_counter()
+    now = time.time()
+    old_tables = ('events', 'divisions', 'teams', 'enrollments', 'matches')
+
+    cursor.execute('SAVEPOINT upgrade')
+    try:
+        for table in old_tables:
+            cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_v1')
+        create_tables(cursor)
+
+        cursor.execute('''
+        INSERT INTO events (eventId, eventName, location, startDate, updated_at)
+        SELECT eventId, eventName, location, startDate, ? FROM events_v1 ORDER BY rowid
+        ''', (now,))
+
+        cursor.execute('''
+        INSERT INTO divisions (divisionId, event, divisionName, teamCount, codeAlias, division_url, updated_at)
+        SELECT d.divisionId, e.id, d.divisionName, d.teamCount, d.codeAlias, d.division_url, ?
+        FROM divisions_v1 d LEFT JOIN events e ON e.eventId = d.eventId
+        ORDER BY d.rowid
+        ''', (now,))
+
+        cursor.execute('''
+        INSERT INTO teams (teamId, teamName, teamCode, clubId, clubName, teamAge, updated_at)
+        SELECT teamId, teamName, teamCode, clubId, clubName, teamAge, ? FROM teams_v1 ORDER BY rowid
+        ''', (now,))
+        # Opponents that only ever appeared in schedules still need an id
+        cursor.execute('''
+        INSERT OR IGNORE INTO teams (teamId, updated_at)
+        SELECT team1_id, ? FROM matches_v1 WHERE team1_id IS NOT NULL
+        UNION SELECT team2_id, ? FROM matches_v1 WHERE team2_id IS NOT NULL
+        UNION SELECT teamId, ? FROM enrollments_v1 WHERE teamId IS NOT NULL
+        ''', (now, now, now))
+
+        cursor.execute('''
+        INSERT INTO enrollments (
+            team, division, matchesWon, matchesLost,
+            setsWon, setsLost, finishRank, overallRank, matchUrl
+        )
+        SELECT t.id, d.id, e.matchesWon, e.matchesLost,
+               e.setsWon, e.setsLost, e.finishRank, e.overallRank, e.matchUrl
+        FROM enrollments_v1 e
+        LEFT JOIN teams t ON t.teamId = e.teamId
+        LEFT JOIN divisions d ON d.divisionId = e.divisionId
+        ORDER BY e.rowid
+        ''')
+
+        # strftime('%s') reads the datetime text like to_epoch(): UTC unless it carries an offset
+        cursor.execute('''
+        INSERT INTO matches (
+            matchId, bracket, team1, team2, team2_won,
+            set1_team1_score, set1_team2_score,
+            set2_team1_score, set2_team2_score,
+            set3_team1_score, set3_team2_score,
+            match_time
+        )
+        SELECT m.matchId, m.bracket, t1.id, t2.id, m.team2_won,
+               m.set1_team1_score, m.set1_team2_score,
+               m.set2_team1_score, m.set2_team2_score,
+               m.set3_team1_score, m.set3_team2_score,
+               CAST(strftime('%s', m.match_datetime) AS INTEGER)
+        FROM matches_v1 m
+        LEFT JOIN teams t1 ON t1.teamId = m.team1_id
+        LEFT JOIN teams t2 ON t2.teamId = m.team2_id
+        ORDER BY m.matchId
+        ''')
+        # New matches keep numbering after the highest matchId ever handed out
+        cursor.execute('''
+        UPDATE sqlite_sequence SET seq = (SELECT seq FROM sqlite_sequence WHERE name = 'matches_v1')
+        WHERE name = 'matches'
+        ''')
+
+        for table in old_tables:
+            cursor.execute(f'DROP TABLE {table}_v1')
+        for table in ('team_elo', 'team_elo_history', 'elo_state'):
+            cursor.execute(f'DROP TABLE IF EXISTS {table}')
+        cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+        cursor.execute('RELEASE upgrade')
+    except Exception:
+        cursor.execute('ROLLBACK TO upgrade')
+        cursor.execute('RELEASE upgrade')
+        raise
+
+    # Hand the space of the old tables back to the file system
+    cursor.execute('VACUUM')
+    print(f"Migrated in {time.perf_counter() - started:.1f}s; "
+          "ELO ratings were dropped and are rebuilt by the next elo.py run")
+
+
+def create_indexes(cursor, secondary=True):
+    """Create the natural key on matches and, unless secondary=False, the secondary indexes, if missing"""
+    if secondary:
+        for name, columns in SECONDARY_INDEXES.items():
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {columns}')
+
+    # Every match shows up in both teams' schedules; the natural key rejects the second copy on insert
+    migrate_match_natural_key(cursor)
+    migrate_enrollment_natural_key(cursor)
+
+
+def migrate_match_natural_key(cursor):
+    """
+    Enforce one row per (bracket, match_time, unordered team pair) with a unique index.
+    Databases created before the index existed are de-duplicated once, first.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_matches_natural_key'")
+    if cursor.fetchone():
+        return
+
+    remove_duplicate_matches(cursor)
+    cursor.execute('''
+    CREATE UNIQUE INDEX idx_matches_natural_key
+    ON matches(bracket, match_time, min(team1, team2), max(team1, team2))
+    ''')
+    print("Created unique natural key on matches")
+
+def migrate_enrollment_natural_key(cursor):
+    """
+    Enforce one enrollment per (team, division) with a unique index, keeping the latest
+    row of databases that piled up copies on reruns. It also serves lookups by team, so
+    it replaces idx_enrollments_team.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_enrollments_natural_key'")
+    if cursor.fetchone():
+        return
+
+    cursor.execute('''
+    DELETE FROM enrollments
+    WHERE rowid NOT IN (SELECT MAX(rowid) FROM enrollments GROUP BY team, division)
+    ''')
+    if cursor.rowcount:
+        print(f"Removed {cursor.rowcount} duplicate enrollments")
+    cursor.execute('CREATE UNIQUE INDEX idx_enrollments_natural_key ON enrollments(team, division)')
+    cursor.execute('DROP INDEX IF EXISTS idx_enrollments_team')
+    print("Created unique natural key on enrollments")
+
+
+def remove_duplicate_matches(cursor):
+    """
+    Remove duplicate matches where team1 and team2 are swapped, keeping the earliest row.
+    Returns how many were removed; nothing to do once the natural key index exists.
+    """
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type='index' AND name='idx_matches_natural_key'")
+    if cursor.fetchone():
+        return 0
+
+    # One grouping pass over the natural key instead of a self-correlated EXISTS per row.
+    # Matches without a start time never compare equal, so they are left alone.
+    with metrics.timer('aes_dedupe_seconds'):
+        cursor.execute('''
+        DELETE FROM matches
+        WHERE match_time IS NOT NULL
+          AND matchId NOT IN (
+            SELECT MIN(matchId)
+            FROM matches
+            WHERE match_time IS NOT NULL
+            GROUP BY bracket, match_time, min(team1, team2), max(team1, team2)
+        )
+        ''')
+
+    deleted_count = cursor.rowcount
+    metrics.inc('aes_duplicates_removed_total', deleted_count)
+    if deleted_count:
+        cursor.execute("SELECT COUNT(*) FROM matches")
+        print(f"Removed {deleted_count} duplicate matches, {cursor.fetchone()[0]} remain")
+    return deleted_count
@@ -0,0 +1,148 @@
+import argparse
+import os
+import time
+
+import samplescraper
+from samplescraper import EVENT_ON_CONFLICT, DIVISION_ON_CONFLICT, ENROLLMENT_ON_CONFLICT, MATCH_ON_CONFLICT
+
+
+def merge_shard(conn, shard_path):
+    """
+    Merge one shard database into the connection's database, in a single transaction.
+    An event and all its divisions, enrollments and matches live in exactly one shard, so
+    they are upserted as the crawl would have written them. Teams play in events of several
+    shards: a team row is updated only with the shard's non-NULL values that differ.
+    The shard's integer ids mean nothing here, so every reference is looked up again by
+    its AES id. Matches go through the natural key like crawled ones, so merging a shard
+    twice is a no-op. The frontier is crawl bookkeeping and stays with the shard.
+    Returns the number of rows inserted or changed per table.
+    """
+    cursor = conn.cursor()
+    conn.commit()
+    cursor.execute('ATTACH DATABASE ? AS shard', (shard_path,))
+    merged = {}
+    try:
+        cursor.execute(f'''
+        INSERT INTO events (eventId, eventName, location, startDate, updated_at)
+        SELECT eventId, eventName, location, startDate, updated_at FROM shard.events WHERE true
+        {EVENT_ON_CONFLICT}
+        ''')
+        merged['events'] = cursor.rowcount
+
+        cursor.execute(f'''
+        INSERT INTO divisions (divisionId, event, divisionName, teamCount, codeAlias, division_url, updated_at)
+        SELECT d.divisionId, (SELECT id FROM main.events WHERE eventId = e.eventId),
+               d.divisionName, d.teamCount, d.codeAlias, d.division_url, d.updated_at
+        FROM shard.divisions d
+        LEFT JOIN shard.events e ON e.id = d.event
+        WHERE true
+        {DIVISION_ON_CONFLICT}
+        ''')
+        merged['divisions'] = cursor.rowcount
+
+        cursor.execute('''
+        INSERT INTO teams (teamId, teamName, teamCode, clubId, clubName, teamAge, updated_at)
+        SELECT teamId, teamName, teamCode, clubId, clubName, teamAge, updated_at FROM shard.teams WHERE true
+        ON CONFLICT (teamId) DO UPDATE SET
+            teamName = COALESCE(excluded.teamName, teams.teamName),
+            teamCode = COALESCE(excluded.teamCode, teams.teamCode),
+            clubId = COALESCE(excluded.clubId, teams.clubId),
+            clubName = COALESCE(excluded.clubName, teams.clubName),
+            teamAge = COALESCE(excluded.teamAge, teams.teamAge),
+            updated_at = excluded.updated_at
+        WHERE COALESCE(excluded.teamName, teams.teamName) IS NOT teams.teamName
+           OR COALESCE(excluded.teamCode, teams.teamCode) IS NOT teams.teamCode
+           OR COALESCE(excluded.clubId, teams.clubId) IS NOT teams.clubId
+           OR COALESCE(excluded.clubName, teams.clubName) IS NOT teams.clubName
+           OR COALESCE(excluded.teamAge, teams.teamAge) IS NOT teams.teamAge
+        ''')
+        merged['teams'] = cursor.rowcount
+
+        # Shards crawled before enrollments had a natural key may hold copies: take the latest
+        cursor.execute(f'''
+        INSERT INTO enrollments (
+            team, division, matchesWon, matchesLost,
+            setsWon, setsLost, finishRank, overallRank, matchUrl
+        )
+        SELECT (SELECT id FROM main.teams WHERE teamId = t.teamId),
+               (SELECT id FROM main.divisions WHERE divisionId = d.divisionId),
+               e.matchesWon, e.matchesLost,
+               e.setsWon, e.setsLost, e.finishRank, e.overallRank, e.matchUrl
+        FROM shard.enrollments e
+        LEFT JOIN shard.teams t ON t.id = e.team
+        LEFT JOIN shard.divisions d ON d.id = e.division
+        WHERE e.rowid IN (SELECT MAX(rowid) FROM shard.enrollments GROUP BY team, division)
+        {ENROLLMENT_ON_CONFLICT}
+        ''')
+        merged['enrollments'] = cursor.rowcount
+
+        # In shard ingest order, so new matchIds keep the order the shard saw them in.
+        # updated_at is the merge time: the ELO run and delta export watermarks are this database's
+        now = time.time()
+        cursor.execute(f'''
+        INSERT INTO matches (
+            bracket, team1, team2, team2_won,
+            set1_team1_score, set1_team2_score,
+            set2_team1_score, set2_team2_score,
+            set3_team1_score, set3_team2_score,
+            match_time, updated_at
+        )
+        SELECT m.bracket,
+               (SELECT id FROM main.teams WHERE teamId = t1.teamId),
+               (SELECT id FROM main.teams WHERE teamId = t2.teamId),
+               m.team2_won,
+               m.set1_team1_score, m.set1_team2_score,
+               m.set2_team1_score, m.set2_team2_score,
+               m.set3_team1_score, m.set3_team2_score,
+               m.match_time, ?
+        FROM shard.matches m
+        LEFT JOIN shard.teams t1 ON t1.id = m.team1
+        LEFT JOIN shard.teams t2 ON t2.id = m.team2
+        WHERE true
+        ORDER BY m.matchId
+        {MATCH_ON_CONFLICT}
+        ''', (now,))
+        merged['matches'] = cursor.rowcount
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.execute('DETACH DATABASE shard')
+    return merged
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge shard databases from samplescraper.py --shard into one database")
+    parser.add_argument('shards', nargs='+', metavar='SHARD_DB', help="shard databases to merge, in order")
+    parser.add_argument('--into', default=samplescraper.DB_PATH,
+                        help=f"database to merge into, created if missing (default {samplescraper.DB_PATH})")
+    args = parser.parse_args()
+
+    for shard_path in args.shards:
+        if not os.path.exists(shard_path):
+            parser.error(f"no such shard database: {shard_path}")
+        if os.path.abspath(shard_path) == os.path.abspath(args.into):
+            parser.error(f"cannot merge {shard_path} into itself")
+
+    # Shards written by an older scraper are migrated to the current schema first
+    for shard_path in args.shards:
+        samplescraper.DB_PATH = shard_path
+        samplescraper.init_database().close()
+
+    # Same schema, natural key and pragmas as a crawl of the target database
+    samplescraper.DB_PATH = args.into
+    conn = samplescraper.init_database()
+    try:
+        for shard_path in args.shards:
+            started = time.perf_counter()
+            merged = merge_shard(conn, shard_path)
+            counts = ', '.join(f"{count} {table}" for table, count in merged.items())
+            print(f"Merged {shard_path} in {time.perf_counter() - started:.1f}s: {counts}")
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import argparse
+import os
+import zlib
+
+
+def parse_shard(spec):
+    """Parse an 'INDEX/COUNT' shard spec such as '2/8' into (index, count)"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected INDEX/COUNT, got {spec!r}")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..COUNT-1, got {spec!r}")
+    return index, count
+
+
+def shard_of(event_key, count):
+    """
+    Shard that crawls an event. A stable hash of the event key, so every worker
+    computes the same partition whatever host or process it runs in.
+    """
+    return zlib.crc32(event_key.encode('utf-8')) % count
+
+
+def shard_db_path(db_path, index, count):
+    """Database a shard crawls into, beside db_path: vbdatav4.db -> vbdatav4.shard2of8.db"""
+    root, ext = os.path.splitext(db_path)
+    return f'{root}.shard{index}of{count}{ext}'
@@ -0,0 +1,33 @@
+import time
+import unittest
+
+from fetcher import AdaptiveRate, TokenBucket
+
+
+class TokenBucketTest(unittest.TestCase):
+
+    def test_pause_then_cut_waits_as_long_as_asked(self):
+        # A 429 with Retry-After pauses the bucket and cuts its rate in the same observe()
+        bucket = TokenBucket(rate=10)
+        controller = AdaptiveRate(bucket)
+        controller.observe(0.01, 429, retry_after=0.5)
+        self.assertEqual(bucket.rate, 5)
+
+        started = time.monotonic()
+        bucket.acquire()
+        waited = time.monotonic() - started
+
+        # The pause, then one token at the new rate; not the pause again as token debt
+        self.assertGreaterEqual(waited, 0.5)
+        self.assertLess(waited, 0.5 + 2 / bucket.rate)
+
+    def test_set_rate_keeps_earned_tokens(self):
+        bucket = TokenBucket(rate=10)
+        bucket.tokens = 0.0
+        time.sleep(0.2)
+        bucket.set_rate(10)
+        self.assertGreaterEqual(bucket.tokens, 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()